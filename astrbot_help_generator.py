@@ -1,4 +1,6 @@
-from PIL import Image, ImageDraw, ImageFont
+# PIL只在生成帮助图片时导入，不拖慢插件加载
+from functools import lru_cache
+import glob
 import textwrap
 import os
 import platform
@@ -6,7 +8,8 @@ import platform
 from astrbot import logger
 
 # ================== 配置区 ==================
-# 字体路径配置（根据系统自动选择）
+# 字体路径配置（根据系统自动选择），首次生成图片时才查找
+@lru_cache(maxsize=None)
 def get_font_path():
     system = platform.system()
     if system == "Windows":
@@ -28,10 +31,26 @@ def get_font_path():
                 return path
         return None
 
-FONT_PATH = get_font_path()
-
 OUTPUT_IMAGE = "data/plugins/astrbot_plugin_omniapi/data/help_cmd.png"
 
+
+def help_image_path(key: str) -> str:
+    """按命令集哈希生成帮助图片路径，不同命令集互不覆盖"""
+    base, ext = os.path.splitext(OUTPUT_IMAGE)
+    return f"{base}_{key}{ext}"
+
+
+def list_help_images(path: str) -> list:
+    """与 path 同目录的所有帮助图片，包括旧版本不带哈希的 help_cmd.png"""
+    base, ext = os.path.splitext(OUTPUT_IMAGE)
+    directory = os.path.dirname(path)
+    pattern = os.path.join(glob.escape(directory), f"{os.path.basename(base)}_*{ext}")
+    paths = glob.glob(pattern)
+    legacy = os.path.join(directory, os.path.basename(OUTPUT_IMAGE))
+    if os.path.exists(legacy):
+        paths.append(legacy)
+    return paths
+
 # 颜色配置
 BG_COLOR = (250, 250, 255)  # 背景：浅蓝白
 TITLE_COLOR = (0, 82, 255)  # 标题蓝
@@ -48,14 +67,19 @@ FOOTER_FONT_SIZE = 18
 
 
 # ===========================================
+@lru_cache(maxsize=None)
 def get_font(size):
-    if FONT_PATH:
+    """加载字体，同一字号在进程内只加载一次"""
+    from PIL import ImageFont
+
+    font_path = get_font_path()
+    if font_path:
         try:
-            font = ImageFont.truetype(FONT_PATH, size)
-            logger.info(f"✅ 使用字体: {FONT_PATH}")
+            font = ImageFont.truetype(font_path, size)
+            logger.info(f"✅ 使用字体: {font_path}")
             return font
         except OSError:
-            logger.warning(f"⚠️ 字体加载失败: {FONT_PATH}")
+            logger.warning(f"⚠️ 字体加载失败: {font_path}")
     logger.warning("⚠️ 使用默认字体（可能不支持中文）")
     return ImageFont.load_default()
 
@@ -113,6 +137,8 @@ def parse_commands(raw_text: str):
 
 
 def generate_help_image(raw_text: str, output_path: str):
+    from PIL import Image, ImageDraw
+
     categories, footer = parse_commands(raw_text)
 
     # 初始化字体
@@ -169,8 +195,10 @@ def generate_help_image(raw_text: str, output_path: str):
         y_offset += 15
         draw.text((40, y_offset), footer, fill=TEXT_COLOR, font=footer_font)
 
-    # 保存
-    image.save(output_path, "PNG", quality=95)
+    # 保存，先写临时文件再替换，避免读取到未写完的图片
+    temp_path = f"{output_path}.tmp"
+    image.save(temp_path, "PNG", quality=95)
+    os.replace(temp_path, output_path)
     logger.info(f"✅ 帮助图片已生成: {os.path.abspath(output_path)}")
     return output_path
 
@@ -0,0 +1,102 @@
+"""
+插件冷启动耗时检查：在全新的解释器中导入插件主模块，超过预算时以非零状态退出
+
+需要在装有AstrBot的环境中运行：
+    python bench/import_time.py --budget-ms 300
+
+- AstrBot自身的模块（astrbot.api 等）先行导入，不计入插件耗时，与插件在宿主中加载时的情况一致
+- 每次测量都启动新的子进程，取多次运行的中位数，避免模块缓存影响
+- 同时检查 PIL、requests 等重型依赖没有在导入阶段被加载，它们应在首次使用时才导入
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+PLUGIN_DIR = BENCH_DIR.parent
+
+# 只允许在首次使用时导入的模块
+LAZY_MODULES = ("PIL", "pydub", "requests", "pysilk")
+
+# 宿主在加载插件前已导入的模块
+HOST_MODULES = ("astrbot.api", "astrbot.api.event", "astrbot.api.star", "astrbot.api.message_components")
+
+PROBE = """
+import importlib, json, sys, time
+sys.path.insert(0, {parent!r})
+for name in {host!r}:
+    importlib.import_module(name)
+before = set(sys.modules)
+started = time.perf_counter()
+importlib.import_module({module!r})
+elapsed = time.perf_counter() - started
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(set(sys.modules) - before)}}))
+"""
+
+
+def measure(module: str, importtime: bool = False) -> Dict[str, Any]:
+    """在子进程中导入一次插件，返回耗时、新加载的模块以及 -X importtime 的原始输出"""
+    code = PROBE.format(parent=str(PLUGIN_DIR.parent), host=HOST_MODULES, module=module)
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=str(PLUGIN_DIR))
+    if completed.returncode != 0:
+        raise SystemExit(f"导入失败:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["importtime"] = completed.stderr
+    return result
+
+
+def slowest_modules(importtime: str, modules: List[str], top: int) -> List[tuple]:
+    """解析 -X importtime 输出，返回插件导入期间自身耗时最长的模块"""
+    loaded = set(modules)
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not parts[0].isdigit():
+            continue
+        name = parts[2].strip()
+        if name in loaded:
+            rows.append((int(parts[0]) / 1000, name))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OmniAPI 冷启动导入耗时检查")
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="导入耗时预算（毫秒），中位数超出时失败")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数")
+    parser.add_argument("--top", type=int, default=10, help="列出自身耗时最长的模块数")
+    args = parser.parse_args()
+
+    module = f"{PLUGIN_DIR.name}.main"
+    timings = [measure(module)["ms"] for _ in range(args.runs)]
+    detail = measure(module, importtime=True)
+    median = statistics.median(timings)
+
+    print(f"导入 {module}: 中位数 {median:.1f} ms（{', '.join(f'{t:.1f}' for t in timings)}），"
+          f"预算 {args.budget_ms:.0f} ms，新加载模块 {len(detail['modules'])} 个")
+    print("自身耗时最长的模块:")
+    for ms, name in slowest_modules(detail["importtime"], detail["modules"], args.top):
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failures = []
+    eager = sorted({name.split(".")[0] for name in detail["modules"]} & set(LAZY_MODULES))
+    if eager:
+        failures.append(f"导入阶段加载了应延迟导入的模块: {', '.join(eager)}")
+    if median > args.budget_ms:
+        failures.append(f"导入耗时 {median:.1f} ms 超出预算 {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ 冷启动耗时在预算内")
+
+
+if __name__ == "__main__":
+    main()
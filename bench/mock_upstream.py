@@ -0,0 +1,236 @@
+"""
+本地模拟上游：模仿 api.317ak.cn 的JSON接口和媒体文件接口，供离线压测使用
+
+- 文本接口（/api/wz/*）返回 {"text": ...}
+- 语音接口（/api/yljk/*）返回 {"url": 语音文件地址}
+- 带 type=json 参数的接口返回 {"data": 媒体地址, "tag": ...}，count>1 时 data 为列表
+- 其余视频（/api/sp/*）和图片（/api/tp/*、/api/qtapi/*）接口302重定向到 /media/ 下的文件
+- /media/ 下的文件支持 Range 请求（返回206），用于分段下载
+- 响应延迟和文件大小按对数正态分布随机生成
+
+单独运行：python bench/mock_upstream.py --port 8765
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+MEDIA_TYPES = {
+    "video": ("mp4", "video/mp4"),
+    "image": ("png", "image/png"),
+    "audio": ("mp3", "audio/mpeg"),
+}
+
+SAMPLE_TEXTS = [
+    "今天也要好好吃饭。",
+    "世界那么大，总有人在等你。",
+    "晚安，好梦。",
+    "慢慢来，比较快。",
+    "生活明朗，万物可爱。",
+]
+
+
+def _silent_mp3() -> Optional[bytes]:
+    """用ffmpeg生成一段静音mp3，使语音转码链路可以真实执行；没有ffmpeg时返回None"""
+    if not shutil.which("ffmpeg"):
+        return None
+    try:
+        return subprocess.run(
+            ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "anullsrc=r=24000:cl=mono", "-t", "2",
+             "-f", "mp3", "pipe:1"],
+            capture_output=True, check=True, timeout=30).stdout
+    except Exception:
+        return None
+
+
+class MockUpstream:
+    """模拟上游HTTP服务，支持keep-alive"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 80.0, latency_sigma: float = 0.5,
+                 video_kb: float = 2048.0, image_kb: float = 256.0, size_sigma: float = 0.6,
+                 distinct: int = 50, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.sizes_kb = {"video": video_kb, "image": image_kb}
+        self.size_sigma = size_sigma
+        self.distinct = distinct
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._media: Dict[Tuple[str, int], bytes] = {}
+        self._mp3 = _silent_mp3()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.requests = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+    def _media_body(self, kind: str, media_id: int) -> bytes:
+        key = (kind, media_id)
+        body = self._media.get(key)
+        if body is None:
+            if kind == "audio" and self._mp3:
+                body = self._mp3
+            else:
+                size_kb = self.sizes_kb.get(kind, 64.0) * self.random.lognormvariate(0, self.size_sigma)
+                body = os.urandom(max(1, int(size_kb * 1024)))
+            self._media[key] = body
+        return body
+
+    def _media_url(self, kind: str) -> str:
+        media_id = self.random.randrange(self.distinct)
+        return f"{self.base_url}/media/{kind}/{media_id}.{MEDIA_TYPES[kind][0]}"
+
+    @staticmethod
+    def _kind_for(path: str) -> str:
+        if path.startswith("/api/sp/") or path.startswith("/api/jhsp"):
+            return "video"
+        if path.startswith("/api/yljk/"):
+            return "audio"
+        return "image"
+
+    @staticmethod
+    def _slice(body: bytes, byte_range: Optional[str]) -> Tuple[int, Dict[str, str], bytes]:
+        """按 Range: bytes=start-end 截取文件，不支持多段范围"""
+        if not byte_range or not byte_range.startswith("bytes="):
+            return 200, {}, body
+        start, _, end = byte_range[6:].partition("-")
+        first = int(start)
+        last = min(int(end) if end else len(body) - 1, len(body) - 1)
+        if first > last:
+            return 416, {"Content-Range": f"bytes */{len(body)}"}, b""
+        return 206, {"Content-Range": f"bytes {first}-{last}/{len(body)}"}, body[first:last + 1]
+
+    def _route(self, path: str, query: Dict[str, list],
+               byte_range: Optional[str] = None) -> Tuple[int, Dict[str, str], bytes]:
+        if path.startswith("/media/"):
+            try:
+                _, _, kind, name = path.split("/", 3)
+                media_id = int(name.split(".")[0])
+                status, headers, body = self._slice(self._media_body(kind, media_id), byte_range)
+            except (ValueError, KeyError):
+                return 404, {}, b"not found"
+            return status, {"Content-Type": MEDIA_TYPES[kind][1], "Accept-Ranges": "bytes", **headers}, body
+
+        if path.startswith("/api/wz/"):
+            payload = {"code": 200, "text": self.random.choice(SAMPLE_TEXTS)}
+        elif path.startswith("/api/yljk/"):
+            payload = {"code": 200, "url": self._media_url("audio")}
+        elif query.get("type", [""])[0] == "json" or path.startswith("/api/jhsp"):
+            kind = self._kind_for(path)
+            count = int(query.get("count", ["1"])[0] or 1)
+            urls = [self._media_url(kind) for _ in range(count)]
+            payload = {"code": 200, "data": urls if count > 1 else urls[0], "tag": "模拟数据"}
+        else:
+            return 302, {"Location": self._media_url(self._kind_for(path))}, b""
+        return 200, {"Content-Type": "application/json; charset=utf-8"}, json.dumps(payload).encode("utf-8")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                byte_range = None
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    if line.lower().startswith(b"connection:") and b"close" in line.lower():
+                        keep_alive = False
+                    if line.lower().startswith(b"range:"):
+                        byte_range = line.split(b":", 1)[1].strip().decode("latin-1")
+                parts = request_line.decode("latin-1").split()
+                if len(parts) < 2:
+                    break
+                self.requests += 1
+                target = urlsplit(parts[1])
+
+                await asyncio.sleep(self._latency())
+                if not target.path.startswith("/media/") and self.random.random() < self.error_rate:
+                    status, headers, body = 500, {}, b"mock error"
+                else:
+                    status, headers, body = self._route(target.path, parse_qs(target.query), byte_range)
+
+                head = [f"HTTP/1.1 {status} {'OK' if status in (200, 206) else 'MOCK'}",
+                        f"Content-Length: {len(body)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{name}: {value}" for name, value in headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                # 大文件分块写出，模拟真实的流式下载
+                for offset in range(0, len(body), 64 * 1024):
+                    writer.write(body[offset:offset + 64 * 1024])
+                    await writer.drain()
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """模拟上游的命令行参数，压测脚本共用"""
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="上游响应延迟中位数（毫秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="延迟对数正态分布的sigma")
+    parser.add_argument("--video-kb", type=float, default=2048.0, help="视频文件大小中位数（KB）")
+    parser.add_argument("--image-kb", type=float, default=256.0, help="图片文件大小中位数（KB）")
+    parser.add_argument("--size-sigma", type=float, default=0.6, help="文件大小对数正态分布的sigma")
+    parser.add_argument("--distinct", type=int, default=50, help="每种媒体的不同文件数，影响缓存命中率")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="上游接口返回500的概率")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现")
+
+
+def from_arguments(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> MockUpstream:
+    return MockUpstream(host=host, port=port, latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                        video_kb=args.video_kb, image_kb=args.image_kb, size_sigma=args.size_sigma,
+                        distinct=args.distinct, error_rate=args.error_rate, seed=args.seed)
+
+
+async def _serve(args: argparse.Namespace):
+    upstream = from_arguments(args, args.host, args.port)
+    await upstream.start()
+    print(f"listening {upstream.base_url}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await upstream.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OmniAPI 本地模拟上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0为随机端口")
+    add_arguments(parser)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+离线压测：启动本地模拟上游，把合成的群聊指令流经 Main.handle_command 回放，统计吞吐和资源占用
+
+需要在装有AstrBot的环境中运行（插件依赖 astrbot.api），不访问任何外网：
+    python bench/run_bench.py --messages 2000 --concurrency 32 --json result.json
+    python bench/run_bench.py --messages 2000 --concurrency 32 --compare result.json
+
+- 插件在临时工作目录中运行，API配置由 plugin_apis.json 改写为指向模拟上游，缓存等文件不会写入真实数据目录
+- 模拟上游运行在子进程中，统计到的内存峰值和文件描述符只属于插件本身
+- 生图接口依赖魔搭异步任务，不在回放范围内
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = Path(__file__).resolve().parent
+PLUGIN_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import mock_upstream  # noqa: E402
+
+# 不参与回放的API
+SKIPPED_APIS = {"生图"}
+
+# 等待后台投递结果的最长时间（秒）
+DELIVERY_TIMEOUT = 120.0
+
+# 合成消息所需的参数
+MESSAGE_ARGS = {
+    "星座运势": "-白羊",
+    "原神语音": "-派蒙-今天也要加油哦",
+}
+
+
+class BenchContext:
+    """替代AstrBot的Context，记录主动推送的消息；后台投递的结果交给等待该会话的回放协程"""
+
+    def __init__(self):
+        self.sent = 0
+        self._waiters: Dict[str, asyncio.Future] = {}
+
+    def expect(self, umo: str) -> asyncio.Future:
+        """等待该会话的下一条主动推送"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[umo] = future
+        return future
+
+    async def send_message(self, umo, chain):
+        self.sent += 1
+        future = self._waiters.pop(umo, None)
+        if future is not None and not future.done():
+            future.set_result(chain)
+
+
+class BenchEvent:
+    """替代AstrMessageEvent，只实现插件用到的接口"""
+
+    _sequence = 0
+
+    def __init__(self, message: str, user_id: str, group_id: str):
+        self.message_str = message
+        self._user_id = user_id
+        self._group_id = group_id
+        # 每条消息使用独立的会话标识，以便把后台推送的结果对应回这条消息
+        BenchEvent._sequence += 1
+        self.unified_msg_origin = f"bench:GroupMessage:{group_id}:{BenchEvent._sequence}"
+
+    def get_sender_id(self) -> str:
+        return self._user_id
+
+    def get_group_id(self) -> str:
+        return self._group_id
+
+    def plain_result(self, text: str) -> Tuple[str, Any]:
+        return "plain", text
+
+    def chain_result(self, chain: list) -> Tuple[str, Any]:
+        return "chain", chain
+
+
+def classify(replies: List[Tuple[str, Any]], media_type: str) -> str:
+    """根据插件的回复判断本次请求的结果"""
+    if not replies:
+        return "silent"
+    # 后台投递失败时插件推送的是AstrBot的MessageChain
+    if not isinstance(replies[-1], tuple):
+        return "error"
+    kind, content = replies[-1]
+    if kind == "chain":
+        return "ok"
+    text = str(content)
+    if text.startswith("正在获取"):
+        return "queued"
+    if text.startswith("当前请求较多"):
+        return "busy"
+    if text.startswith("操作太频繁"):
+        return "limited"
+    if text.startswith("❌") or "失败" in text or "熔断" in text:
+        return "error"
+    return "ok" if media_type == "text" else "other"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def open_fds() -> Optional[int]:
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            continue
+    return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        media_type, _, weight = item.partition("=")
+        mix[media_type.strip()] = float(weight or 1)
+    return mix
+
+
+def prepare_workdir(workdir: Path, base_url: str, args: argparse.Namespace) -> Dict[str, List[str]]:
+    """写入指向模拟上游的API配置和压测用系统配置，返回按类型分组的指令"""
+    with open(PLUGIN_DIR / "plugin_apis.json", "r", encoding="utf-8") as file:
+        apis = json.load(file)
+    mock = urlsplit(base_url)
+    commands: Dict[str, List[str]] = {}
+    bench_apis = {}
+    for name, api in apis.items():
+        if name in SKIPPED_APIS or not api.get("url"):
+            continue
+        parts = urlsplit(api["url"])
+        api["url"] = urlunsplit((mock.scheme, mock.netloc, parts.path, parts.query, parts.fragment))
+        bench_apis[name] = api
+        for cmd in api.get("command", []):
+            commands.setdefault(api.get("type", ""), []).append(cmd + MESSAGE_ARGS.get(name, ""))
+
+    system_config = {
+        "api_keys": "bench",
+        "enable_text": True,
+        "enable_image": True,
+        "enable_audio": True,
+        "enable_video": True,
+        "config_reload_interval": 0,
+        "enable_rate_limit": args.rate_limit,
+        "metrics_port": 0,
+    }
+    for item in args.set:
+        key, _, value = item.partition("=")
+        try:
+            system_config[key] = json.loads(value)
+        except json.JSONDecodeError:
+            system_config[key] = value
+
+    api_path = workdir / "data/plugins/astrbot_plugin_omniapi/plugin_apis.json"
+    system_path = workdir / "data/config/astrbot_plugin_omniapi_config.json"
+    api_path.parent.mkdir(parents=True, exist_ok=True)
+    system_path.parent.mkdir(parents=True, exist_ok=True)
+    api_path.write_text(json.dumps(bench_apis, ensure_ascii=False), encoding="utf-8")
+    system_path.write_text(json.dumps(system_config, ensure_ascii=False), encoding="utf-8")
+    return commands
+
+
+def synthesize(count: int, commands: Dict[str, List[str]], mix: Dict[str, float], users: int, groups: int,
+               rng: random.Random) -> List[Tuple[str, str, str, str]]:
+    """生成 (消息, 类型, 用户, 群) 序列"""
+    types = [t for t in mix if commands.get(t) and mix[t] > 0]
+    if not types:
+        raise SystemExit(f"--mix 中没有可用的类型，可选: {', '.join(sorted(commands))}")
+    weights = [mix[t] for t in types]
+    messages = []
+    for _ in range(count):
+        media_type = rng.choices(types, weights)[0]
+        messages.append((rng.choice(commands[media_type]), media_type,
+                         str(10000 + rng.randrange(users)), str(20000 + rng.randrange(groups))))
+    return messages
+
+
+async def start_upstream(args: argparse.Namespace) -> Tuple[asyncio.subprocess.Process, str]:
+    cmd = [sys.executable, str(BENCH_DIR / "mock_upstream.py"), "--port", "0",
+           "--latency-ms", str(args.latency_ms), "--latency-sigma", str(args.latency_sigma),
+           "--video-kb", str(args.video_kb), "--image-kb", str(args.image_kb),
+           "--size-sigma", str(args.size_sigma), "--distinct", str(args.distinct),
+           "--error-rate", str(args.error_rate)]
+    if args.seed is not None:
+        cmd += ["--seed", str(args.seed)]
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE)
+    line = (await asyncio.wait_for(process.stdout.readline(), 30)).decode().strip()
+    if not line.startswith("listening "):
+        process.kill()
+        raise SystemExit(f"模拟上游启动失败: {line}")
+    return process, line.split(" ", 1)[1]
+
+
+async def replay(plugin, context: BenchContext, messages, concurrency: int,
+                 samples: Dict[str, int]) -> Tuple[List[float], Dict[str, int]]:
+    queue = list(reversed(messages))
+    latencies: List[float] = []
+    outcomes: Dict[str, int] = {}
+
+    async def worker():
+        while queue:
+            message, media_type, user_id, group_id = queue.pop()
+            event = BenchEvent(message, user_id, group_id)
+            delivered = context.expect(event.unified_msg_origin)
+            started = time.perf_counter()
+            replies = [reply async for reply in plugin.handle_command(event)]
+            outcome = classify(replies, media_type)
+            # 后台投递时以结果推送到达的时间计算端到端延迟
+            if outcome == "queued":
+                try:
+                    replies.append(await asyncio.wait_for(delivered, DELIVERY_TIMEOUT))
+                except asyncio.TimeoutError:
+                    replies.append(("plain", "❌ 后台投递超时"))
+                outcome = classify(replies, media_type)
+            latencies.append(time.perf_counter() - started)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    async def sampler():
+        while True:
+            fds = open_fds()
+            if fds is not None:
+                samples["peak_fds"] = max(samples.get("peak_fds", 0), fds)
+            await asyncio.sleep(0.05)
+
+    sampling = asyncio.create_task(sampler())
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        sampling.cancel()
+    return latencies, outcomes
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    upstream, base_url = await start_upstream(args)
+    workdir = Path(tempfile.mkdtemp(prefix="omniapi_bench_"))
+    cwd = os.getcwd()
+    plugin = None
+    try:
+        commands = prepare_workdir(workdir, base_url, args)
+        # 插件的配置、缓存路径都相对于工作目录
+        os.chdir(workdir)
+        sys.path.insert(0, str(PLUGIN_DIR.parent))
+        plugin_main = importlib.import_module(f"{PLUGIN_DIR.name}.main")
+        from astrbot.api import logger
+        logger.setLevel(args.log_level)
+
+        baseline_fds = open_fds()
+        context = BenchContext()
+        plugin = plugin_main.Main(context)
+        await plugin.initialize()
+
+        mix = parse_mix(args.mix)
+        samples: Dict[str, int] = {}
+        if args.warmup:
+            await replay(plugin, context, synthesize(args.warmup, commands, mix, args.users, args.groups, rng),
+                         args.concurrency, samples)
+        messages = synthesize(args.messages, commands, mix, args.users, args.groups, rng)
+        started = time.perf_counter()
+        latencies, outcomes = await replay(plugin, context, messages, args.concurrency, samples)
+        elapsed = time.perf_counter() - started
+
+        metrics = plugin.metrics
+        latencies.sort()
+        return {
+            "label": args.label,
+            "messages": len(messages),
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "seconds": round(elapsed, 3),
+            "messages_per_sec": round(len(messages) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {name: round(percentile(latencies, q) * 1000, 1)
+                           for name, q in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99),
+                                           ("max", 1.0))},
+            "outcomes": outcomes,
+            "upstream_requests": int(sum(v for (name, _), v in metrics.counters.items()
+                                         if name == "omniapi_upstream_requests_total")),
+            "downloaded_mb": round(sum(v for (name, _), v in metrics.counters.items()
+                                       if name == "omniapi_downloaded_bytes_total") / 1024 / 1024, 1),
+            "peak_rss_mb": round(peak_rss_mb() or 0, 1),
+            "baseline_fds": baseline_fds,
+            "peak_fds": samples.get("peak_fds"),
+        }
+    finally:
+        if plugin is not None:
+            await plugin.terminate()
+        os.chdir(cwd)
+        upstream.kill()
+        await upstream.wait()
+        if args.keep_workdir:
+            print(f"工作目录已保留: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(result: Dict[str, Any], previous: Optional[Dict[str, Any]] = None):
+    def delta(value, old_value, lower_is_better=True) -> str:
+        if old_value in (None, 0) or value is None:
+            return ""
+        change = (value - old_value) / old_value * 100
+        worse = change > 0 if lower_is_better else change < 0
+        return f"  ({change:+.1f}%{' ↓' if worse and abs(change) >= 5 else ''})"
+
+    prev = previous or {}
+    prev_latency = prev.get("latency_ms", {})
+    print(f"== {result['label'] or 'bench'}: {result['messages']} 条消息，并发 {result['concurrency']}，"
+          f"耗时 {result['seconds']}s")
+    print(f"吞吐: {result['messages_per_sec']} msg/s"
+          f"{delta(result['messages_per_sec'], prev.get('messages_per_sec'), lower_is_better=False)}")
+    for name, value in result["latency_ms"].items():
+        print(f"延迟 {name}: {value} ms{delta(value, prev_latency.get(name))}")
+    print(f"结果: {', '.join(f'{k}={v}' for k, v in sorted(result['outcomes'].items()))}")
+    print(f"上游请求: {result['upstream_requests']}，下载 {result['downloaded_mb']} MB"
+          f"{delta(result['upstream_requests'], prev.get('upstream_requests'))}")
+    print(f"内存峰值: {result['peak_rss_mb']} MB{delta(result['peak_rss_mb'], prev.get('peak_rss_mb'))}")
+    print(f"文件描述符: 基线 {result['baseline_fds']}，峰值 {result['peak_fds']}"
+          f"{delta(result['peak_fds'], prev.get('peak_fds'))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OmniAPI 离线压测")
+    parser.add_argument("--messages", type=int, default=1000, help="回放的消息数")
+    parser.add_argument("--warmup", type=int, default=50, help="预热消息数，不计入结果")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时处理的消息数")
+    parser.add_argument("--mix", default="text=4,image=3,video=3",
+                        help="各类型消息的权重，如 text=4,image=3,video=2,audio=1（语音需要ffmpeg）")
+    parser.add_argument("--users", type=int, default=200, help="合成用户数")
+    parser.add_argument("--groups", type=int, default=20, help="合成群数")
+    parser.add_argument("--rate-limit", action="store_true", help="保留用户/群限流（默认关闭以测量吞吐）")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="覆盖插件系统配置，值按JSON解析，如 --set scheduler_max_concurrent=32")
+    parser.add_argument("--label", default="", help="本次运行的名称")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--compare", help="与之前保存的JSON结果对比")
+    parser.add_argument("--log-level", default="WARNING", help="插件日志级别")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留临时工作目录")
+    mock_upstream.add_arguments(parser)
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            previous = json.load(file)
+
+    result = asyncio.run(run(args))
+    print_report(result, previous)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
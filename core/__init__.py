@@ -1,9 +1,44 @@
 from .apiManager import APIManager
 from .apiHandle import APIHandle
 from .request import RequestManager
+from .commandRouter import CommandRouter
+from .prefetch import URLPrefetcher
+from .mediaCache import MediaCache
+from .responseCache import ResponseCache, CachePolicy
+from .recentlySent import RecentlySent, RepeatedMedia
+from .imageJobs import ImageJobScheduler
+from .delivery import BackgroundDelivery
+from .healthProbe import HealthProbe
+from .transcoder import AudioTranscoder
+from .circuitBreaker import CircuitBreakerRegistry
+from .singleFlight import SingleFlight, RandomBatcher
+from .scheduler import RequestScheduler, SchedulerBusy
+from .rateLimiter import RateLimiter
+from .metrics import MetricsRegistry
+from .apiDescriptor import APIDescriptor, MediaType
 
 __all__ = [
     "APIManager",
     "RequestManager",
-    "APIHandle"
+    "APIHandle",
+    "CommandRouter",
+    "URLPrefetcher",
+    "MediaCache",
+    "ResponseCache",
+    "CachePolicy",
+    "RecentlySent",
+    "RepeatedMedia",
+    "ImageJobScheduler",
+    "BackgroundDelivery",
+    "HealthProbe",
+    "AudioTranscoder",
+    "CircuitBreakerRegistry",
+    "SingleFlight",
+    "RandomBatcher",
+    "RequestScheduler",
+    "SchedulerBusy",
+    "RateLimiter",
+    "MetricsRegistry",
+    "APIDescriptor",
+    "MediaType"
 ]
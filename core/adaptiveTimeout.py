@@ -0,0 +1,215 @@
+"""自适应超时：按API统计连接耗时、首包延迟和传输速率，为每次请求分别计算连接、首包和总传输时间上限"""
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from .circuitBreaker import PROBE_EXTENSION
+
+# 估计值 = 平均值 + DEVIATION_FACTOR × 平均偏差，与TCP重传超时的计算方式相同
+DEVIATION_FACTOR = 4.0
+MEAN_GAIN = 0.125
+DEVIATION_GAIN = 0.25
+# 样本数不足时使用配置的上限
+MIN_SAMPLES = 5
+# 只用足够大的响应体估计传输速率，小响应体的耗时主要是首包延迟
+MIN_RATE_SAMPLE_BYTES = 64 * 1024
+
+
+class EWMA:
+    """指数加权的平均值与平均偏差"""
+    __slots__ = ("mean", "deviation", "count")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.deviation = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        if self.count == 0:
+            self.mean = value
+            self.deviation = value / 2
+        else:
+            self.deviation += DEVIATION_GAIN * (abs(value - self.mean) - self.deviation)
+            self.mean += MEAN_GAIN * (value - self.mean)
+        self.count += 1
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= MIN_SAMPLES
+
+    def estimate(self) -> float:
+        return self.mean + DEVIATION_FACTOR * self.deviation
+
+
+class _Estimates:
+    __slots__ = ("connect", "first_byte", "rate", "size")
+
+    def __init__(self):
+        self.connect = EWMA()
+        self.first_byte = EWMA()
+        self.rate = EWMA()
+        self.size = EWMA()
+
+
+def _clamp(value: float, lower: float, upper: float) -> float:
+    return max(lower, min(upper, value))
+
+
+class AdaptiveTimeouts:
+    """
+    按标签（API名称或主机名）估计三段超时
+    - 连接：建立TCP/TLS连接的耗时
+    - 首包：请求发出到收到响应头的耗时，也作为读取响应体时两次数据之间的最长等待
+    - 总传输：请求开始到响应体读完，按Content-Length（没有时按历史响应大小）和历史传输速率估算
+    每段都限制在配置的下限与上限之间；关闭时所有请求使用固定的 http_timeout
+    """
+
+    def __init__(self):
+        self.enable = True
+        self.default = 30.0
+        self.connect_min, self.connect_max = 1.0, 10.0
+        self.first_byte_min, self.first_byte_max = 3.0, 30.0
+        self.total_min, self.total_max = 10.0, 300.0
+        self._estimates: Dict[str, _Estimates] = {}
+
+    def configure(self, enable: bool, default: float, connect_min: float, connect_max: float,
+                  first_byte_min: float, first_byte_max: float, total_min: float, total_max: float):
+        """应用配置，上限小于下限时以下限为准"""
+        self.enable = enable
+        self.default = default
+        self.connect_min, self.connect_max = connect_min, max(connect_min, connect_max)
+        self.first_byte_min, self.first_byte_max = first_byte_min, max(first_byte_min, first_byte_max)
+        self.total_min, self.total_max = total_min, max(total_min, total_max)
+
+    def _get(self, label: str) -> _Estimates:
+        estimates = self._estimates.get(label)
+        if estimates is None:
+            estimates = self._estimates[label] = _Estimates()
+        return estimates
+
+    def observe_connect(self, label: str, seconds: float):
+        self._get(label).connect.observe(seconds)
+
+    def observe_first_byte(self, label: str, seconds: float):
+        self._get(label).first_byte.observe(seconds)
+
+    def observe_body(self, label: str, size: int, seconds: float):
+        estimates = self._get(label)
+        estimates.size.observe(size)
+        if size >= MIN_RATE_SAMPLE_BYTES and seconds > 0:
+            estimates.rate.observe(size / seconds)
+
+    def connect_timeout(self, label: str) -> float:
+        estimate = self._estimates.get(label)
+        if estimate is None or not estimate.connect.ready:
+            return self.connect_max
+        return _clamp(estimate.connect.estimate(), self.connect_min, self.connect_max)
+
+    def first_byte_timeout(self, label: str) -> float:
+        estimate = self._estimates.get(label)
+        if estimate is None or not estimate.first_byte.ready:
+            return self.first_byte_max
+        return _clamp(estimate.first_byte.estimate(), self.first_byte_min, self.first_byte_max)
+
+    def timeout(self, label: str) -> httpx.Timeout:
+        """本次请求的httpx超时：connect为连接超时，read/write为首包超时"""
+        if not self.enable:
+            return httpx.Timeout(self.default)
+        first_byte = self.first_byte_timeout(label)
+        return httpx.Timeout(first_byte, connect=self.connect_timeout(label), pool=self.first_byte_max)
+
+    def total_budget(self, label: str, content_length: Optional[int]) -> Optional[float]:
+        """请求开始到响应体读完的时间上限，关闭时返回None（不限制）"""
+        if not self.enable:
+            return None
+        estimate = self._estimates.get(label)
+        if estimate is None or not estimate.rate.ready:
+            return self.total_max
+        size = content_length
+        if size is None:
+            if not estimate.size.ready:
+                return self.total_max
+            size = estimate.size.estimate()
+        # 按平均速率估算的传输时间留出 DEVIATION_FACTOR 倍余量
+        transfer = DEVIATION_FACTOR * size / max(estimate.rate.mean, 1.0)
+        return _clamp(self.first_byte_timeout(label) + transfer, self.total_min, self.total_max)
+
+    def report(self) -> List[str]:
+        """各标签当前的超时估计，供管理员指令展示"""
+        lines = []
+        for label, estimate in sorted(self._estimates.items()):
+            if not estimate.first_byte.count:
+                continue
+            total = self.total_budget(label, None)
+            lines.append(f"{label}: 连接 {self.connect_timeout(label):.1f}s / 首包 {self.first_byte_timeout(label):.1f}s"
+                         f" / 总计 {'不限' if total is None else f'{total:.0f}s'}")
+        return lines
+
+
+class _DeadlineStream(httpx.AsyncByteStream):
+    """响应体超过总传输时间时中止读取，读完后记录大小和耗时"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, request: httpx.Request, deadline: Optional[float],
+                 on_complete: Callable[[int, float], None]):
+        self.stream = stream
+        self.request = request
+        self.deadline = deadline
+        self.on_complete = on_complete
+
+    async def __aiter__(self):
+        started = time.monotonic()
+        size = 0
+        async for chunk in self.stream:
+            size += len(chunk)
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                raise httpx.ReadTimeout(f"超过总传输时间上限: {self.request.url}", request=self.request)
+            yield chunk
+        self.on_complete(size, time.monotonic() - started)
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+
+class AdaptiveTimeoutTransport(httpx.AsyncBaseTransport):
+    """包装底层传输层，采集连接、首包和传输速率样本，并对响应体施加总传输时间上限；健康探测不采样"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, timeouts: AdaptiveTimeouts,
+                 label_for: Callable[[str], str]):
+        self.transport = transport
+        self.timeouts = timeouts
+        self.label_for = label_for
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.extensions.get(PROBE_EXTENSION):
+            return await self.transport.handle_async_request(request)
+        label = self.label_for(str(request.url))
+        connect = {}
+        parent_trace = request.extensions.get("trace")
+
+        # 只有新建连接时才会产生connect事件，复用连接的请求不记录连接耗时
+        async def trace(event: str, info: dict):
+            if event == "connection.connect_tcp.started":
+                connect["started"] = time.monotonic()
+            elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                connect["complete"] = time.monotonic()
+            if parent_trace is not None:
+                await parent_trace(event, info)
+
+        request.extensions["trace"] = trace
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        connect_seconds = connect.get("complete", 0.0) - connect.get("started", 0.0) if "started" in connect else 0.0
+        if connect_seconds > 0:
+            self.timeouts.observe_connect(label, connect_seconds)
+        self.timeouts.observe_first_byte(label, time.monotonic() - started - connect_seconds)
+
+        content_length = response.headers.get("Content-Length", "")
+        budget = self.timeouts.total_budget(label, int(content_length) if content_length.isdigit() else None)
+        response.stream = _DeadlineStream(
+            response.stream, request, started + budget if budget is not None else None,
+            lambda size, seconds: self.timeouts.observe_body(label, size, seconds))
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
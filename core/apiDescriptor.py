@@ -0,0 +1,134 @@
+"""API描述对象：加载配置时把 plugin_apis.json 的每一项编译为只读描述对象，请求时不再查字典、不修改共享配置"""
+from enum import Enum
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+from astrbot.api import logger
+
+from .extractor import Extractor, compile_path
+from .responseCache import CachePolicy
+
+
+class MediaType(str, Enum):
+    """API类型，取值与 plugin_apis.json 中的 type 相同，可直接作为字符串键使用"""
+    TEXT = "text"
+    IMAGE = "image"
+    AUDIO = "audio"
+    VIDEO = "video"
+
+    __str__ = str.__str__
+
+
+# (类型, videoType/imageType) -> APIHandle 中的处理方法名；文本和语音不区分子类型
+HANDLERS = {
+    (MediaType.TEXT, ""): "handle_text_type",
+    (MediaType.AUDIO, ""): "handle_audio_type",
+    (MediaType.VIDEO, "video"): "handle_video_type",
+    (MediaType.VIDEO, "url"): "handle_video_url_type",
+    (MediaType.IMAGE, "image"): "handle_image_type",
+    (MediaType.IMAGE, "url"): "handle_image_url_type",
+}
+
+# 所有请求默认携带的请求头，API中配置的同名请求头优先
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+}
+
+
+class APIDescriptor:
+    """
+    编译后的API配置，创建后不可修改
+    - headers 为合并默认值后的元组，可直接传给httpx
+    - params 为只读映射，已注入ckey；请求层合并本次请求的参数时生成新字典，不修改共享的基础参数
+    - urls 为主地址加镜像地址，按优先级排列；url 和 host 对应主地址
+    - handler 为处理方法名，error 非空时表示配置无效，不能处理
+    - cache 为响应缓存策略，未配置时为None
+    """
+    __slots__ = ("name", "media_type", "mode", "commands", "description", "url", "urls", "host", "headers",
+                 "params", "handler", "error", "extract", "coalesce", "batch_param", "prefetch", "probe", "hedge", "cache")
+
+    def __init__(self, **fields):
+        for slot in self.__slots__:
+            object.__setattr__(self, slot, fields[slot])
+
+    def __setattr__(self, key, value):
+        raise AttributeError("APIDescriptor是只读的")
+
+    def __repr__(self):
+        return f"APIDescriptor({self.name!r}, {self.media_type}, {self.url!r})"
+
+
+def _merge_headers(headers: Mapping[str, str]) -> Tuple[Tuple[str, str], ...]:
+    merged = {name.lower(): (name, value) for name, value in DEFAULT_HEADERS.items()}
+    for name, value in (headers or {}).items():
+        merged[name.lower()] = (name, str(value))
+    return tuple(merged.values())
+
+
+def compile_api(name: str, api_data: Dict[str, Any], ckey: Optional[str]) -> APIDescriptor:
+    """
+    编译单个API配置
+    :raises ValueError: extract路径语法错误或cache配置无效
+    """
+    url = api_data.get("url", "").strip()
+    # 主地址在前，镜像按配置顺序排列，去掉空值和重复项
+    urls = tuple(dict.fromkeys(u.strip() for u in [url, *api_data.get("mirrors", [])] if u and u.strip()))
+    type_name = api_data.get("type", "")
+    try:
+        media_type: Optional[MediaType] = MediaType(type_name)
+    except ValueError:
+        media_type = None
+
+    mode = ""
+    if media_type is MediaType.VIDEO:
+        mode = api_data.get("videoType", "")
+    elif media_type is MediaType.IMAGE:
+        mode = api_data.get("imageType", "")
+
+    error = ""
+    if not type_name:
+        error = f"API '{name}' 未配置type"
+    elif media_type is None:
+        error = f"不支持的API类型: {type_name}"
+    elif (media_type, mode) not in HANDLERS:
+        error = f"不支持的{'视频' if media_type is MediaType.VIDEO else '图片'}类型: {mode}"
+    elif not url:
+        error = "API配置缺少url字段"
+
+    expression = api_data.get("extract")
+    extract: Optional[Extractor] = compile_path(expression) if expression else None
+    cache = CachePolicy.parse(api_data.get("cache"))
+
+    return APIDescriptor(
+        name=api_data.get("name", name),
+        media_type=media_type,
+        mode=mode,
+        commands=tuple(cmd.strip().lower() for cmd in api_data.get("command", []) if cmd.strip()),
+        description=api_data.get("description", ""),
+        url=url,
+        urls=urls,
+        host=urlsplit(url).hostname or "",
+        headers=_merge_headers(api_data.get("headers", {})),
+        params=MappingProxyType({**api_data.get("params", {}), "ckey": ckey or ""}),
+        handler=HANDLERS.get((media_type, mode)) if not error else None,
+        error=error,
+        extract=extract,
+        coalesce=bool(api_data.get("coalesce", False)),
+        batch_param=api_data.get("batchParam") or "",
+        prefetch=api_data.get("prefetch", True) is not False,
+        probe=api_data.get("probe", True) is not False,
+        hedge=bool(api_data.get("hedge", False)),
+        cache=cache,
+    )
+
+
+def compile_apis(apis: Dict[str, Dict[str, Any]], ckey: Optional[str]) -> Dict[str, APIDescriptor]:
+    """编译全部API配置，单个配置无效时记录错误并跳过"""
+    descriptors = {}
+    for name, api_data in apis.items():
+        try:
+            descriptors[name] = compile_api(name, api_data, ckey)
+        except Exception as e:
+            logger.error(f"API '{name}' 配置无效: {str(e)}")
+    return descriptors
@@ -1,74 +1,206 @@
 """各种类型api的处理"""
-from astrbot.api.event import filter, AstrMessageEvent
+from astrbot.api.event import filter, AstrMessageEvent, MessageChain
+from astrbot.api.star import Context
 from astrbot.api import logger
 from astrbot.api.message_components import Video, Plain, At, Record, Image
 import os
+from typing import Awaitable, Callable, Optional
 
 from .request import RequestManager
 from .apiManager import APIManager
+from .prefetch import URLPrefetcher
+from .imageJobs import ImageJobScheduler
+from .recentlySent import RecentlySent, RecentRing, RepeatedMedia
+from .apiDescriptor import APIDescriptor, HANDLERS
 
 class APIHandle:
     """API处理类"""
-    def __init__(self):
+    def __init__(self, context: Context | None = None):
+        self.context = context  # 用于任务完成后主动推送消息
         self.request = RequestManager()
+        self.metrics = self.request.metrics
         self.api_manager = APIManager()
-        self.enable_text = self.api_manager.get_enable_text()
-        self.enable_image = self.api_manager.get_enable_image()
-        self.enable_audio = self.api_manager.get_enable_voice()
-        self.enable_video = self.api_manager.get_enable_video()
-
-    async def handle_text_type(self, api_config: dict, event: AstrMessageEvent):
+        job_config = self.api_manager.get_image_job_config()
+        self.image_jobs = ImageJobScheduler(
+            self.request,
+            max_concurrent=job_config["max_concurrent"],
+            max_pending=job_config["max_pending"],
+            daily_quota=job_config["daily_quota"],
+        )
+        prefetch_config = self.api_manager.get_prefetch_config()
+        self.prefetcher = URLPrefetcher(max_depth=prefetch_config["max_depth"], ttl=prefetch_config["ttl"],
+                                        metrics=self.metrics)
+        self.recent = RecentlySent(window=self.api_manager.get_dedup_config()["window"])
+        self.metrics.register_gauge("image_jobs_pending", lambda: self.image_jobs.pending)
+        self.metrics.register_gauge("image_quota_remaining", lambda: self.image_jobs.remaining_quota)
+        self.metrics.register_gauge("coalesced_in_flight", lambda: self.request.coalescer.in_flight)
+        # 处理方法只解析一次，按APIDescriptor.handler直接取用
+        self.handlers = {name: getattr(self, name) for name in set(HANDLERS.values())}
+
+    # 开关从共享配置快照读取，配置热重载后立即生效
+    @property
+    def enable_text(self):
+        return self.api_manager.get_enable_text()
+
+    @property
+    def enable_image(self):
+        return self.api_manager.get_enable_image()
+
+    @property
+    def enable_audio(self):
+        return self.api_manager.get_enable_voice()
+
+    @property
+    def enable_video(self):
+        return self.api_manager.get_enable_video()
+
+    async def terminate(self):
+        """停止后台任务并关闭HTTP客户端"""
+        await self.prefetcher.close()
+        await self.image_jobs.close()
+        await self.request.terminate()
+
+    def _cleanup_temp_file(self, temp_path: str | bytes | None):
+        """清理临时文件，由媒体缓存管理的文件保留到被淘汰为止；内存中的内容无需清理"""
+        if not isinstance(temp_path, str) or not os.path.exists(temp_path):
+            return
+        media_cache = self.request.media_cache
+        if media_cache and media_cache.owns(temp_path):
+            return
+        try:
+            os.remove(temp_path)
+            logger.info(f"临时文件已删除: {temp_path}")
+        except Exception as e:
+            logger.warning(f"删除临时文件失败: {str(e)}")
+
+    def _make_image_job_callback(self, api: APIDescriptor, event: AstrMessageEvent):
+        """生成生图任务完成后的推送回调"""
+        umo = event.unified_msg_origin
+        sender_id = event.get_sender_id()
+        name = api.name
+
+        async def on_done(image_url: str | None):
+            if image_url:
+                chain = [
+                    At(qq=sender_id),
+                    Plain(f"你的{name}请查收！"),
+                    Image.fromURL(url=str(image_url)),
+                ]
+            else:
+                self.metrics.inc("omniapi_errors_total", name)
+                chain = [At(qq=sender_id), Plain(f"❌ {name}生成失败，请稍后再试")]
+            await self.context.send_message(umo, MessageChain(chain=chain))
+
+        return on_done
+
+    def _prefetch_enabled(self, api: APIDescriptor) -> bool:
+        """全局开关开启且API未单独关闭预取"""
+        return bool(self.api_manager.get_prefetch_config()["enable"]) and api.prefetch
+
+    @staticmethod
+    def _usage(api: APIDescriptor) -> str:
+        """缺少参数时的提示，取API描述的第一行作为用法"""
+        usage = api.description.splitlines()[0] if api.description else f"命令格式：/{api.commands[0]}-参数"
+        return f"缺少参数，{usage}"
+
+    def _recent_items(self, api: APIDescriptor, event: AstrMessageEvent) -> Optional[RecentRing]:
+        """本会话最近发送过的该API内容；结果固定的接口（开启请求合并或响应缓存）不去重"""
+        dedup_config = self.api_manager.get_dedup_config()
+        if not dedup_config["enable"] or api.coalesce or api.cache is not None:
+            return None
+        self.recent.resize(dedup_config["window"])
+        return self.recent.ring((event.unified_msg_origin, api.name))
+
+    async def _fresh_url(self, api: APIDescriptor, event: AstrMessageEvent,
+                         resolve: Callable[[], Awaitable[str | None]]) -> str | None:
+        """获取本会话最近没有发送过的URL，重复时重新获取，重试次数用完后照常发送"""
+        recent = self._recent_items(api, event)
+        media_url = await resolve()
+        if recent is None:
+            return media_url
+        for _ in range(self.api_manager.get_dedup_config()["max_retries"]):
+            if not media_url or media_url not in recent:
+                break
+            logger.info(f"{api.name}返回了最近发送过的内容，重新获取: {media_url}")
+            self.metrics.inc("omniapi_repeats_total", api.name)
+            media_url = await resolve()
+        if media_url:
+            recent.add(str(media_url))
+        return media_url
+
+    async def _resolve_video_url(self, api: APIDescriptor) -> str | None:
+        """请求上游解析一个视频URL"""
+        url, headers, params = api.urls, api.headers, api.params
+        if api.name == "随机视频":
+            return await self.request.get_random_video(url, headers=headers, params=params, hedge=api.hedge)
+        batch_param = api.batch_param
+        if batch_param:
+            return await self.request.get_batched_url(url, headers=headers, params=params, batch_param=batch_param,
+                                                      extract=api.extract, hedge=api.hedge)
+        return await self.request.get_video_url(url, headers=headers, params=params,
+                                                coalesce=api.coalesce,
+                                                extract=api.extract, hedge=api.hedge, cache=api.cache)
+
+    async def _resolve_image_url(self, api: APIDescriptor, msg: str) -> str | None:
+        """请求上游解析一个图片URL"""
+        url, headers, params = api.urls, api.headers, api.params
+        batch_param = api.batch_param
+        if batch_param:
+            return await self.request.get_batched_url(url, headers=headers, params={**params, "msg": msg},
+                                                      batch_param=batch_param, extract=api.extract,
+                                                      hedge=api.hedge)
+        return await self.request.get_image_url(url, headers=headers, params=params, msg=msg,
+                                                coalesce=api.coalesce,
+                                                extract=api.extract, hedge=api.hedge, cache=api.cache)
+
+    async def handle_text_type(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
         """处理text类型的API"""
         if self.enable_text == False:
             yield event.plain_result("暂未开启文本API功能")
             return
 
-        logger.info(f"{api_config.get('name', '')}为text文本类型")
+        logger.info(f"{api.name}为text文本类型")
 
         try:
             # 获取URL和参数
-            url = api_config.get("url", "").strip()
-            headers = api_config.get("headers", {})
-            params = api_config.get("params", {})
-
-            if not url:
-                yield event.plain_result("API配置缺少url字段")
-                return
+            url, headers, params = api.urls, api.headers, api.params
 
-            text = await self.request.get_text(url, headers=headers, params=params)
+            text = await self.request.get_text(url, headers=headers, params=params,
+                                               coalesce=api.coalesce,
+                                               extract=api.extract, hedge=api.hedge, cache=api.cache)
             yield event.plain_result(text)
 
         except Exception as e:
-            logger.error(f"处理{api_config.get('name', '')}text类型失败: {str(e)}", exc_info=True)
-            yield event.plain_result(f"❌ {api_config.get('name', '')}文本处理失败: {str(e)}")
+            logger.error(f"处理{api.name}text类型失败: {str(e)}", exc_info=True)
+            self.metrics.inc("omniapi_errors_total", api.name)
+            yield event.plain_result(f"❌ {api.name}文本处理失败: {str(e)}")
 
 
-    async def handle_audio_type(self, api_config: dict, event: AstrMessageEvent):
+    async def handle_audio_type(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
         """处理audio类型的API"""
         if self.enable_audio == False:
             yield event.plain_result("暂未开启语音API功能")
             return
 
-        logger.info(f"{api_config.get('name', '')}为audio语音类型")
+        logger.info(f"{api.name}为audio语音类型")
 
         try:
             # 获取URL和参数
-            name = api_config.get("name", "")
-            url = api_config.get("url", "").strip()
-            headers = api_config.get("headers", {})
-            params = api_config.get("params", {})
-            message_str = event.message_str
-            role = message_str.split("-")[1]
-            msg = message_str.split("-")[2]
-
-            if not url:
-                yield event.plain_result("API配置缺少url字段")
+            name = api.name
+            url, headers, params = api.urls, api.headers, api.params
+            # 参数格式为 角色-文本，文本中可以再包含 -
+            role, _, msg = args.partition("-")
+            role, msg = role.strip(), msg.strip()
+            if not role or not msg:
+                yield event.plain_result(self._usage(api))
                 return
 
             # 下载语音
-            temp_path = await self.request.get_audio_url(url, headers=headers, params=params, role=role, msg=msg)
+            temp_path = await self.request.get_audio_url(url, headers=headers, params=params, role=role, msg=msg,
+                                                         extract=api.extract, hedge=api.hedge)
             if not temp_path or not os.path.exists(temp_path):
-                yield event.plain_result(f"{api_config.get('name', '')}语音下载失败或文件不存在")
+                self.metrics.inc("omniapi_errors_total", api.name)
+                yield event.plain_result(f"{api.name}语音下载失败或文件不存在")
                 return
 
             # 统一路径格式
@@ -77,51 +209,52 @@ class APIHandle:
             # 发送视频
             chain = [
                 At(qq=event.get_sender_id()),
-                Plain(f"你的{api_config.get('name', '语音')}请查收！"),
+                Plain(f"你的{api.name}请查收！"),
                 Record(file=temp_path),
             ]
             yield event.chain_result(chain)
-            logger.info(f"{api_config.get('name', '')}语音发送成功: {temp_path}")
+            logger.info(f"{api.name}语音发送成功: {temp_path}")
 
         except Exception as e:
-            logger.error(f"处理{api_config.get('name', '')}audio类型失败: {str(e)}", exc_info=True)
-            yield event.plain_result(f"❌ {api_config.get('name', '')}语音处理失败: {str(e)}")
+            logger.error(f"处理{api.name}audio类型失败: {str(e)}", exc_info=True)
+            self.metrics.inc("omniapi_errors_total", api.name)
+            yield event.plain_result(f"❌ {api.name}语音处理失败: {str(e)}")
         finally:
-            # 清理临时文件
-            if 'temp_path' in locals() and temp_path and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                    logger.info(f"临时文件已删除: {temp_path}")
-                except Exception as e:
-                    logger.warning(f"删除临时文件失败: {str(e)}")
+            self._cleanup_temp_file(locals().get('temp_path'))
 
 
-    async def handle_video_type(self, api_config: dict, event: AstrMessageEvent):
+    async def handle_video_type(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
         """处理video类型的API"""
         if self.enable_video == False:
             yield event.plain_result("暂未开启视频API功能")
             return
 
-        logger.info(f"{api_config.get('name', '')}为video视频类型，使用get_video函数下载")
+        logger.info(f"{api.name}为video视频类型，使用get_video函数下载")
 
         try:
             # 获取URL和参数
-            name = api_config.get("name", "")
-            url = api_config.get("url", "").strip()
-            headers = api_config.get("headers", {})
-            params = api_config.get("params", {})
-
-            if not url:
-                yield event.plain_result("API配置缺少url字段")
-                return
+            name = api.name
+            url, headers, params = api.urls, api.headers, api.params
 
             # 下载视频
             # if name == "随机视频":
             #     temp_path = await self.request.get_random_video(url, headers=headers, params=params)
             # else:
-            temp_path = await self.request.get_video(url, headers=headers, params=params)
+            # 下载到最近发送过的视频时重新获取，重试次数用完后照常发送
+            recent = self._recent_items(api, event)
+            retries = self.api_manager.get_dedup_config()["max_retries"] if recent is not None else 0
+            for attempt in range(retries + 1):
+                try:
+                    temp_path = await self.request.get_video(url, headers=headers, params=params,
+                                                             coalesce=api.coalesce, recent=recent,
+                                                             allow_repeat=attempt == retries)
+                    break
+                except RepeatedMedia as e:
+                    logger.info(f"{api.name}返回了最近发送过的视频，重新获取: {e}")
+                    self.metrics.inc("omniapi_repeats_total", api.name)
             if not temp_path or not os.path.exists(temp_path):
-                yield event.plain_result(f"{api_config.get('name', '')}视频下载失败或文件不存在")
+                self.metrics.inc("omniapi_errors_total", api.name)
+                yield event.plain_result(f"{api.name}视频下载失败或文件不存在")
                 return
 
             # 统一路径格式
@@ -130,153 +263,154 @@ class APIHandle:
             # 发送视频
             chain = [
                 At(qq=event.get_sender_id()),
-                Plain(f"你的{api_config.get('name', '视频')}请查收！"),
+                Plain(f"你的{api.name}请查收！"),
                 Video.fromFileSystem(path=str(temp_path)),
             ]
             yield event.chain_result(chain)
-            logger.info(f"{api_config.get('name', '')}视频发送成功: {temp_path}")
+            logger.info(f"{api.name}视频发送成功: {temp_path}")
 
         except Exception as e:
-            logger.error(f"处理{api_config.get('name', '')}video类型失败: {str(e)}", exc_info=True)
-            yield event.plain_result(f"❌ {api_config.get('name', '')}视频处理失败: {str(e)}")
+            logger.error(f"处理{api.name}video类型失败: {str(e)}", exc_info=True)
+            self.metrics.inc("omniapi_errors_total", api.name)
+            yield event.plain_result(f"❌ {api.name}视频处理失败: {str(e)}")
         finally:
-            # 清理临时文件
-            if 'temp_path' in locals() and temp_path and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                    logger.info(f"临时文件已删除: {temp_path}")
-                except Exception as e:
-                    logger.warning(f"删除临时文件失败: {str(e)}")
+            self._cleanup_temp_file(locals().get('temp_path'))
 
 
-    async def handle_video_url_type(self, api_config: dict, event: AstrMessageEvent):
+    async def handle_video_url_type(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
         """处理视频url类型的API"""
         if self.enable_video == False:
             yield event.plain_result("暂未开启视频API功能")
             return
 
-        logger.info(f"{api_config.get('name', '')}为url视频类型，使用get_video_url函数下载")
+        logger.info(f"{api.name}为url视频类型，使用get_video_url函数下载")
 
         try:
-            # 获取URL和参数\
-            name = api_config.get("name", "")
-            url = api_config.get("url", "").strip()
-            headers = api_config.get("headers", {})
-            params = api_config.get("params", {})
-
-            if not url:
-                yield event.plain_result("API配置缺少url字段")
-                return
+            name = api.name
 
-            # 获取视频URL
-            if name == "随机视频":
-                video_url = await self.request.get_random_video(url, headers=headers, params=params)
+            # 获取视频URL，开启预取时优先从预取池中取；最近在本会话发送过的URL会重新获取
+            if self._prefetch_enabled(api):
+                video_url = await self._fresh_url(
+                    api, event, lambda: self.prefetcher.get(name, lambda: self._resolve_video_url(api)))
             else:
-                video_url = await self.request.get_video_url(url, headers=headers, params=params)
+                video_url = await self._fresh_url(api, event, lambda: self._resolve_video_url(api))
             if not video_url:
-                yield event.plain_result(f"获取{api_config.get('name', '')}视频URL失败")
+                self.metrics.inc("omniapi_errors_total", api.name)
+                yield event.plain_result(f"获取{api.name}视频URL失败")
                 return
 
             # 发送视频URL
             chain = [
                 At(qq=event.get_sender_id()),
-                Plain(f"你的{api_config.get('name', '视频')}请查收！"),
+                Plain(f"你的{api.name}请查收！"),
                 Video.fromURL(url=str(video_url))
             ]
             yield event.chain_result(chain)
-            logger.info(f"{api_config.get('name', '')}URL发送成功: {video_url}")
+            logger.info(f"{api.name}URL发送成功: {video_url}")
 
         except Exception as e:
-            logger.error(f"{api_config.get('name', '')}url处理失败: {str(e)}", exc_info=True)
-            yield event.plain_result(f"❌ {api_config.get('name', '')}URL处理失败: {str(e)}")
+            logger.error(f"{api.name}url处理失败: {str(e)}", exc_info=True)
+            self.metrics.inc("omniapi_errors_total", api.name)
+            yield event.plain_result(f"❌ {api.name}URL处理失败: {str(e)}")
 
 
-    async def handle_image_type(self, api_config: dict, event: AstrMessageEvent):
+    async def handle_image_type(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
         """处理本地图片类型的API"""
         if self.enable_image == False:
             yield event.plain_result("暂未开启图片API功能")
             return
 
-        logger.info(f"{api_config.get('name', '')}为图片类型，使用get_image_url函数下载")
+        logger.info(f"{api.name}为图片类型，使用get_image_url函数下载")
 
         try:
             # 获取URL和参数
-            name = api_config.get("name", "")
-            url = api_config.get("url", "").strip()
-            headers = api_config.get("headers", {})
-            params = api_config.get("params", {})
-            message_str = event.message_str
-            # 判断是否为星座运势
-            if message_str.split("-")[0] == "星座运势":
-                msg = message_str.split("-")[1]
+            name = api.name
+            url, headers, params = api.urls, api.headers, api.params
+            # 星座运势需要星座参数，其他图片接口不带参数
+            if name == "星座运势":
+                msg = args
+                if not msg:
+                    yield event.plain_result(self._usage(api))
+                    return
             else:
                 msg = ""
 
-            if not url:
-                yield event.plain_result("API配置缺少url字段")
-                return
-
-            # 获取图片URL
-            temp_path = await self.request.get_image(url, headers=headers, params=params, msg=msg)
+            # 下载图片，小图片直接在内存中
+            temp_path = await self.request.get_image(url, headers=headers, params=params, msg=msg,
+                                                     coalesce=api.coalesce, cache=api.cache)
             if not temp_path:
+                self.metrics.inc("omniapi_errors_total", api.name)
                 yield event.plain_result("获取图片URL失败")
                 return
 
-            # 发送视频URL
+            # 发送图片
+            if isinstance(temp_path, bytes):
+                image = Image.fromBytes(temp_path)
+            else:
+                image = Image.fromFileSystem(path=str(temp_path))
             chain = [
                 At(qq=event.get_sender_id()),
-                Plain(f"你的{api_config.get('name', '图片')}请查收！"),
-                Image.fromFileSystem(path=str(temp_path))
+                Plain(f"你的{api.name}请查收！"),
+                image
             ]
             yield event.chain_result(chain)
-            logger.info(f"{api_config.get('name', '')}发送成功: {temp_path}")
+            logger.info(f"{api.name}发送成功: {'内存' if isinstance(temp_path, bytes) else temp_path}")
 
         except Exception as e:
-            logger.error(f"{api_config.get('name', '')}处理失败: {str(e)}", exc_info=True)
-            yield event.plain_result(f"❌ {api_config.get('name', '')}处理失败: {str(e)}")
+            logger.error(f"{api.name}处理失败: {str(e)}", exc_info=True)
+            self.metrics.inc("omniapi_errors_total", api.name)
+            yield event.plain_result(f"❌ {api.name}处理失败: {str(e)}")
+        finally:
+            self._cleanup_temp_file(locals().get('temp_path'))
 
 
-    async def handle_image_url_type(self, api_config: dict, event: AstrMessageEvent):
+    async def handle_image_url_type(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
         """处理图片url类型的API"""
         if self.enable_image == False:
             yield event.plain_result("暂未开启图片API功能")
             return
 
-        logger.info(f"{api_config.get('name', '')}为图片类型，使用get_image_url函数下载")
+        logger.info(f"{api.name}为图片类型，使用get_image_url函数下载")
 
         try:
             # 获取URL和参数
-            name = api_config.get("name", "")
-            url = api_config.get("url", "").strip()
-            headers = api_config.get("headers", {})
-            params = api_config.get("params", {})
-            message_str = event.message_str
-            msg = message_str.split("-")[1]
-
-            if not url:
-                yield event.plain_result("API配置缺少url字段")
+            name = api.name
+            url, headers, params = api.url, api.headers, api.params
+            msg = args
+            if not msg:
+                yield event.plain_result(self._usage(api))
                 return
 
             # 获取图片URL
             # 判断是否为生图
-            if message_str.split("-")[0] == "生图":
+            if name == "生图":
                 logger.info("使用魔搭Z-Image-Turbo生图API")
+                if self.context is not None:
+                    # 后台生成，完成后主动推送，不占用当前处理协程
+                    _, reply = self.image_jobs.submit(url, msg, self._make_image_job_callback(api, event))
+                    yield event.plain_result(reply)
+                    return
                 image_url = await self.request.get_generate_image_url(url, headers=headers, params=params, msg=msg)
+            elif self._prefetch_enabled(api):
+                image_url = await self._fresh_url(
+                    api, event, lambda: self.prefetcher.get((name, msg), lambda: self._resolve_image_url(api, msg)))
             else:
-                image_url = await self.request.get_image_url(url, headers=headers, params=params, msg=msg)
+                image_url = await self._fresh_url(api, event, lambda: self._resolve_image_url(api, msg))
             if not image_url:
+                self.metrics.inc("omniapi_errors_total", api.name)
                 yield event.plain_result("获取图片URL失败")
                 return
 
             # 发送视频URL
             chain = [
                 At(qq=event.get_sender_id()),
-                Plain(f"你的{api_config.get('name', '图片')}请查收！"),
+                Plain(f"你的{api.name}请查收！"),
                 Image.fromURL(url=str(image_url))
             ]
             yield event.chain_result(chain)
-            logger.info(f"{api_config.get('name', '')}URL发送成功: {image_url}")
+            logger.info(f"{api.name}URL发送成功: {image_url}")
 
         except Exception as e:
-            logger.error(f"{api_config.get('name', '')}url处理失败: {str(e)}", exc_info=True)
-            yield event.plain_result(f"❌ {api_config.get('name', '')}URL处理失败: {str(e)}")
\ No newline at end of file
+            logger.error(f"{api.name}url处理失败: {str(e)}", exc_info=True)
+            self.metrics.inc("omniapi_errors_total", api.name)
+            yield event.plain_result(f"❌ {api.name}URL处理失败: {str(e)}")
\ No newline at end of file
@@ -1,29 +1,157 @@
+import asyncio
 import json
+import os
+import threading
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from urllib.parse import urlsplit
 
 from astrbot.api import logger
 
+from .apiDescriptor import APIDescriptor, compile_apis
+
+API_CONFIG_PATH = 'data/plugins/astrbot_plugin_omniapi/plugin_apis.json'
+SYSTEM_CONFIG_PATH = 'data/config/astrbot_plugin_omniapi_config.json'
+
+
+class ConfigSnapshot:
+    """配置快照，创建后不再修改，重载时整体替换"""
+    __slots__ = ("apis", "descriptors", "system_config", "mtimes", "version")
+
+    def __init__(self, apis: Dict[str, Dict[str, Any]], system_config: Dict[str, Any],
+                 mtimes: Tuple[Optional[int], Optional[int]], version: int):
+        self.apis = apis
+        # 编译后的API描述对象，随快照一起替换
+        self.descriptors: Dict[str, APIDescriptor] = compile_apis(apis, system_config.get("api_keys"))
+        self.system_config = system_config
+        self.mtimes = mtimes
+        self.version = version
+
+
+class ConfigStore:
+    """进程内共享的配置缓存，所有APIManager实例共用同一份快照"""
+
+    def __init__(self, api_path: str = API_CONFIG_PATH, system_path: str = SYSTEM_CONFIG_PATH):
+        self.api_path = api_path
+        self.system_path = system_path
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._listeners: List[Callable[[ConfigSnapshot], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """当前配置快照，首次访问时加载"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._build_snapshot(self._current_mtimes())
+                snapshot = self._snapshot
+        return snapshot
+
+    def add_listener(self, listener: Callable[[ConfigSnapshot], None]):
+        """注册配置变更回调"""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[ConfigSnapshot], None]):
+        """移除配置变更回调"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _current_mtimes(self) -> Tuple[Optional[int], Optional[int]]:
+        return self._mtime(self.api_path), self._mtime(self.system_path)
+
+    def _build_snapshot(self, mtimes: Tuple[Optional[int], Optional[int]]) -> ConfigSnapshot:
+        """读取配置文件生成新快照，读取失败时沿用旧快照中的对应部分"""
+        old = self._snapshot
+        try:
+            with open(self.api_path, 'r', encoding='utf-8') as file:
+                apis = json.load(file)
+        except Exception as e:
+            logger.error(f"读取API配置失败: {str(e)}")
+            apis = old.apis if old else {}
+        try:
+            with open(self.system_path, 'r', encoding='utf-8-sig') as file:
+                system_config = json.load(file)
+        except Exception as e:
+            logger.error(f"读取系统配置失败: {str(e)}")
+            system_config = old.system_config if old else {}
+        return ConfigSnapshot(apis, system_config, mtimes, old.version + 1 if old else 1)
+
+    def _publish(self, snapshot: ConfigSnapshot):
+        self._snapshot = snapshot
+        for listener in list(self._listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"配置变更回调执行失败: {str(e)}", exc_info=True)
+
+    def reload(self) -> ConfigSnapshot:
+        """强制从磁盘重新加载配置"""
+        with self._lock:
+            snapshot = self._build_snapshot(self._current_mtimes())
+        self._publish(snapshot)
+        logger.info(f"配置已重新加载，版本: {snapshot.version}")
+        return snapshot
+
+    def replace_apis(self, apis: Dict[str, Dict[str, Any]]):
+        """以新的API字典替换当前快照（写时复制）"""
+        old = self.snapshot
+        self._publish(ConfigSnapshot(apis, old.system_config, old.mtimes, old.version + 1))
+
+    async def watch(self, interval: float):
+        """轮询配置文件的修改时间，发生变化时在后台线程重新加载"""
+        logger.info(f"配置文件监听已启动，轮询间隔: {interval}秒")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                mtimes = self._current_mtimes()
+                if mtimes == self.snapshot.mtimes:
+                    continue
+                snapshot = await asyncio.to_thread(self._build_snapshot, mtimes)
+                self._publish(snapshot)
+                logger.info(f"检测到配置文件变更，已热重载，版本: {snapshot.version}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"配置热重载失败: {str(e)}", exc_info=True)
+
+
+# 全局共享的配置缓存
+config_store = ConfigStore()
+
+
 class APIManager:
     def __init__(self,
                  # config: Dict[str, Any]
                  ):
         # self.config = config
-        self.apis = self._init_apis()
+        self.store = config_store
+
+    @property
+    def apis(self) -> Dict[str, Dict[str, Any]]:
+        """当前快照中的API配置"""
+        return self.store.snapshot.apis
 
     def _init_apis(self) -> Dict[str, Dict[str, Any]]:
         """初始化API配置"""
-        # 读取JSON文件
-        with open('data/plugins/astrbot_plugin_omniapi/plugin_apis.json', 'r', encoding='utf-8') as file:
-            apis = json.load(file)
-        return apis
+        return self.apis
 
     def get_system_config(self) -> Dict[str, Dict[str, Any]]:
-        """获取系统配置"""
-        # 读取JSON文件
-        with open('data/config/astrbot_plugin_omniapi_config.json', 'r', encoding='utf-8-sig') as file:
-            config = json.load(file)
-        return config
+        """获取系统配置（内存快照，不读取磁盘）"""
+        return self.store.snapshot.system_config
+
+    def get_reload_interval(self) -> float:
+        """获取配置文件热重载轮询间隔，0表示关闭"""
+        return float(self.get_system_config().get("config_reload_interval", 5.0))
 
     def get_ckey(self) -> str:
         """获取API的CKEY"""
@@ -51,6 +179,185 @@ class APIManager:
         """获取视频开关配置"""
         return self.get_system_config().get("enable_video")
 
+    def get_http_config(self) -> Dict[str, Any]:
+        """获取HTTP连接池配置"""
+        config = self.get_system_config()
+        return {
+            "timeout": float(config.get("http_timeout", 30.0)),
+            "max_connections": int(config.get("http_max_connections", 100)),
+            "max_keepalive_connections": int(config.get("http_max_keepalive_connections", 20)),
+            "keepalive_expiry": float(config.get("http_keepalive_expiry", 30.0)),
+            "per_host_connections": int(config.get("http_per_host_connections", 20)),
+            "http2": bool(config.get("http_enable_http2", False)),
+        }
+
+    def get_timeout_config(self) -> Dict[str, Any]:
+        """获取自适应超时配置：连接、首包和总传输时间的下限与上限（秒）"""
+        config = self.get_system_config()
+        return {
+            "enable": bool(config.get("timeout_adaptive", True)),
+            "default": float(config.get("http_timeout", 30.0)),
+            "connect_min": float(config.get("timeout_connect_min", 1.0)),
+            "connect_max": float(config.get("timeout_connect_max", 10.0)),
+            "first_byte_min": float(config.get("timeout_first_byte_min", 3.0)),
+            "first_byte_max": float(config.get("timeout_first_byte_max", 30.0)),
+            "total_min": float(config.get("timeout_total_min", 10.0)),
+            "total_max": float(config.get("timeout_total_max", 300.0)),
+        }
+
+    def get_prefetch_config(self) -> Dict[str, Any]:
+        """获取媒体URL预取配置"""
+        config = self.get_system_config()
+        return {
+            "enable": bool(config.get("enable_prefetch", False)),
+            "max_depth": int(config.get("prefetch_max_depth", 3)),
+            "ttl": float(config.get("prefetch_ttl", 120.0)),
+        }
+
+    def get_media_cache_config(self) -> Dict[str, Any]:
+        """获取本地媒体缓存配置"""
+        config = self.get_system_config()
+        return {
+            "enable": bool(config.get("enable_media_cache", True)),
+            "directory": config.get("media_cache_dir") or "data/plugin_data/astrbot_plugin_omniapi/media_cache",
+            "max_bytes": int(float(config.get("media_cache_max_mb", 512)) * 1024 * 1024),
+            "policy": config.get("media_cache_policy", "lru"),
+        }
+
+    def get_download_config(self) -> Dict[str, Any]:
+        """获取媒体下载配置：内存直发阈值、单个文件大小上限（0为不限）和视频分段下载参数"""
+        config = self.get_system_config()
+        return {
+            "memory_bytes": int(float(config.get("media_memory_threshold_kb", 1024)) * 1024),
+            "max_bytes": int(float(config.get("media_max_download_mb", 200)) * 1024 * 1024),
+            "parts": max(1, int(config.get("video_download_parts", 4))),
+            "parallel_min_bytes": int(float(config.get("video_parallel_min_mb", 4)) * 1024 * 1024),
+        }
+
+    def get_delivery_config(self) -> Dict[str, Any]:
+        """获取后台投递配置：开关、适用的API类型（逗号分隔）和排队上限"""
+        config = self.get_system_config()
+        types = config.get("background_delivery_types", "video")
+        return {
+            "enable": bool(config.get("enable_background_delivery", True)),
+            "types": frozenset(t.strip() for t in types.split(",") if t.strip()),
+            "max_pending": int(config.get("background_delivery_max_pending", 32)),
+        }
+
+    def get_health_probe_config(self) -> Dict[str, Any]:
+        """获取API健康探测配置"""
+        config = self.get_system_config()
+        return {
+            "enable": bool(config.get("enable_health_probe", False)),
+            "interval": float(config.get("health_probe_interval", 600.0)),
+            "max_concurrent": int(config.get("health_probe_concurrency", 8)),
+            "timeout": float(config.get("health_probe_timeout", 5.0)),
+        }
+
+    def get_response_cache_config(self) -> Dict[str, Any]:
+        """获取响应缓存配置：开关、条目数上限和内存上限"""
+        config = self.get_system_config()
+        return {
+            "enable": bool(config.get("enable_response_cache", True)),
+            "max_entries": int(config.get("response_cache_max_entries", 1024)),
+            "max_bytes": int(float(config.get("response_cache_max_mb", 32)) * 1024 * 1024),
+        }
+
+    def get_dedup_config(self) -> Dict[str, Any]:
+        """获取最近发送去重配置：开关、每个会话记录的条数和重复时的最多重试次数"""
+        config = self.get_system_config()
+        return {
+            "enable": bool(config.get("enable_recent_dedup", True)),
+            "window": max(1, int(config.get("recent_dedup_window", 20))),
+            "max_retries": max(0, int(config.get("recent_dedup_max_retries", 2))),
+        }
+
+    def get_image_job_config(self) -> Dict[str, Any]:
+        """获取魔搭生图任务调度配置"""
+        config = self.get_system_config()
+        return {
+            "max_concurrent": int(config.get("image_job_max_concurrent", 2)),
+            "max_pending": int(config.get("image_job_max_pending", 20)),
+            "daily_quota": int(config.get("modelscope_daily_quota", 2000)),
+        }
+
+    def get_audio_config(self) -> Dict[str, Any]:
+        """获取语音转码配置"""
+        config = self.get_system_config()
+        return {
+            "max_workers": int(config.get("audio_transcode_workers", 2)),
+            "max_queue": int(config.get("audio_transcode_queue", 8)),
+            "timeout": float(config.get("audio_transcode_timeout", 30.0)),
+            "output_format": config.get("audio_output_format", "wav"),
+        }
+
+    def get_circuit_breaker_config(self) -> Dict[str, Any]:
+        """获取熔断器配置"""
+        config = self.get_system_config()
+        return {
+            "api_failure_threshold": int(config.get("circuit_api_failure_threshold", 5)),
+            "host_failure_threshold": int(config.get("circuit_host_failure_threshold", 10)),
+            "recovery_timeout": float(config.get("circuit_recovery_timeout", 30.0)),
+        }
+
+    def get_scheduler_config(self) -> Dict[str, Any]:
+        """获取请求调度配置"""
+        config = self.get_system_config()
+        return {
+            "max_concurrent": int(config.get("scheduler_max_concurrent", 16)),
+            "per_host": int(config.get("scheduler_host_concurrent", 8)),
+            "per_type": {
+                "text": int(config.get("scheduler_text_concurrent", 8)),
+                "image": int(config.get("scheduler_image_concurrent", 6)),
+                "audio": int(config.get("scheduler_audio_concurrent", 2)),
+                "video": int(config.get("scheduler_video_concurrent", 4)),
+            },
+            "max_queue": int(config.get("scheduler_max_queue", 32)),
+            "queue_timeout": float(config.get("scheduler_queue_timeout", 60.0)),
+        }
+
+    def get_rate_limit_config(self) -> Dict[str, Any]:
+        """获取限流配置，次数均为每分钟，0表示不限"""
+        config = self.get_system_config()
+        return {
+            "enable": bool(config.get("enable_rate_limit", True)),
+            "user_per_minute": float(config.get("rate_limit_user_per_minute", 10)),
+            "user_burst": int(config.get("rate_limit_user_burst", 5)),
+            "group_per_minute": float(config.get("rate_limit_group_per_minute", 40)),
+            "group_burst": int(config.get("rate_limit_group_burst", 15)),
+            "type_per_minute": {
+                "text": float(config.get("rate_limit_text_per_minute", 0)),
+                "image": float(config.get("rate_limit_image_per_minute", 6)),
+                "audio": float(config.get("rate_limit_audio_per_minute", 3)),
+                "video": float(config.get("rate_limit_video_per_minute", 3)),
+            },
+        }
+
+    def get_metrics_config(self) -> Dict[str, Any]:
+        """获取Prometheus指标端口配置，端口为0表示不开启"""
+        config = self.get_system_config()
+        return {
+            "host": str(config.get("metrics_host", "127.0.0.1")),
+            "port": int(config.get("metrics_port", 0)),
+        }
+
+    def get_hedge_config(self) -> Dict[str, Any]:
+        """获取对冲请求配置：样本不足时的初始等待时间和等待时间下限（秒）"""
+        config = self.get_system_config()
+        return {
+            "initial_delay": float(config.get("hedge_initial_delay", 1.0)),
+            "min_delay": float(config.get("hedge_min_delay", 0.2)),
+        }
+
+    def get_api_hosts(self) -> List[str]:
+        """获取所有API配置中出现的上游主机"""
+        hosts = []
+        for descriptor in self.get_all_descriptors().values():
+            for url in descriptor.urls:
+                host = urlsplit(url).hostname
+                if host and host not in hosts:
+                    hosts.append(host)
+        return hosts
 
     def match_api_by_command(self, command: str) -> Optional[Dict[str, Any]]:
         """
@@ -75,13 +382,17 @@ class APIManager:
         """获取所有API配置"""
         return self.apis
 
+    def get_all_descriptors(self) -> Dict[str, APIDescriptor]:
+        """获取所有编译后的API描述对象"""
+        return self.store.snapshot.descriptors
+
     def update_api(self, api_name: str, api_config: Dict[str, Any]):
         """
         更新API配置
         :param api_name: API名称
         :param api_config: 新的API配置
         """
-        self.apis[api_name] = api_config
+        self.store.replace_apis({**self.apis, api_name: api_config})
         logger.info(f"API配置已更新: {api_name}")
 
     def add_api(self, api_config: Dict[str, Any]):
@@ -91,7 +402,7 @@ class APIManager:
         """
         api_name = api_config.get("name")
         if api_name:
-            self.apis[api_name] = api_config
+            self.store.replace_apis({**self.apis, api_name: api_config})
             logger.info(f"API已添加: {api_name}")
 
     def remove_api(self, api_name: str):
@@ -100,5 +411,7 @@ class APIManager:
         :param api_name: API名称
         """
         if api_name in self.apis:
-            del self.apis[api_name]
+            apis = dict(self.apis)
+            del apis[api_name]
+            self.store.replace_apis(apis)
             logger.info(f"API已删除: {api_name}")
@@ -0,0 +1,192 @@
+"""上游熔断：按API和按主机记录健康状态，上游故障时快速失败"""
+import time
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlsplit
+
+import httpx
+
+from astrbot.api import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_LABELS = {CLOSED: "正常", OPEN: "熔断", HALF_OPEN: "探测中"}
+
+# 健康探测请求的扩展标记：熔断、运行指标和自适应超时的传输层都直接放行，不记录结果
+PROBE_EXTENSION = "omniapi_probe"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """熔断器打开时拒绝请求"""
+
+
+class CircuitBreaker:
+    """
+    单个熔断器
+    - closed：正常放行，连续失败达到阈值后打开
+    - open：直接拒绝，冷却时间过后进入half_open
+    - half_open：只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.total_failures = 0
+        self.total_successes = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """是否放行本次请求"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = HALF_OPEN
+            self._probing = False
+        # half_open 只放行一个探测请求
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def release(self):
+        """请求未完成（被拒绝或取消）时归还探测名额"""
+        self._probing = False
+
+    def retry_after(self) -> float:
+        """距离下次允许探测的剩余秒数"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.total_successes += 1
+        self.failures = 0
+        self._probing = False
+        if self.state != CLOSED:
+            logger.info(f"熔断器已恢复: {self.name}")
+            self.state = CLOSED
+
+    def record_failure(self):
+        self.total_failures += 1
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            logger.warning(f"熔断器已打开: {self.name}，连续失败 {self.failures} 次")
+
+
+class CircuitBreakerRegistry:
+    """按API端点和上游主机管理熔断器"""
+
+    def __init__(self, api_failure_threshold: int = 5, host_failure_threshold: int = 10,
+                 recovery_timeout: float = 30.0):
+        self.api_failure_threshold = api_failure_threshold
+        self.host_failure_threshold = host_failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.api_endpoints: Set[str] = set()
+        self._apis: Dict[str, CircuitBreaker] = {}
+        self._hosts: Dict[str, CircuitBreaker] = {}
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        """去掉查询参数后的端点地址"""
+        parts = urlsplit(url.strip())
+        return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+    def set_api_urls(self, urls: List[str]):
+        """设置需要按API单独熔断的端点，其余URL（如媒体直链）只按主机熔断"""
+        self.api_endpoints = {self.endpoint(url) for url in urls if url}
+
+    def _breakers(self, url: str) -> List[CircuitBreaker]:
+        parts = urlsplit(url.strip())
+        breakers = []
+        if parts.hostname:
+            host = self._hosts.get(parts.hostname)
+            if host is None:
+                host = self._hosts[parts.hostname] = CircuitBreaker(
+                    parts.hostname, self.host_failure_threshold, self.recovery_timeout)
+            breakers.append(host)
+        endpoint = self.endpoint(url)
+        if endpoint in self.api_endpoints:
+            api = self._apis.get(endpoint)
+            if api is None:
+                api = self._apis[endpoint] = CircuitBreaker(
+                    endpoint, self.api_failure_threshold, self.recovery_timeout)
+            breakers.append(api)
+        return breakers
+
+    def check(self, url: str) -> Optional[str]:
+        """
+        检查URL对应的熔断器是否打开（不占用探测名额）
+        :return: 打开时返回提示文本，否则返回None
+        """
+        for breaker in self._breakers(url):
+            if breaker.state == OPEN and breaker.retry_after() > 0:
+                return f"该接口暂时不可用，请约{int(breaker.retry_after()) + 1}秒后再试"
+        return None
+
+    def acquire(self, url: str) -> List[CircuitBreaker]:
+        """放行请求并返回相关熔断器，任一熔断器拒绝时抛出CircuitOpenError"""
+        breakers = self._breakers(url)
+        for i, breaker in enumerate(breakers):
+            if not breaker.allow():
+                for allowed in breakers[:i]:
+                    allowed.release()
+                raise CircuitOpenError(f"熔断器已打开: {breaker.name}")
+        return breakers
+
+    def describe(self) -> str:
+        """生成熔断状态的文本报告"""
+        lines = ["上游健康状态："]
+        for title, breakers in (("主机", self._hosts), ("接口", self._apis)):
+            lines.append(f"[{title}]")
+            if not breakers:
+                lines.append("  暂无记录")
+            for breaker in breakers.values():
+                line = (f"  {breaker.name}: {STATE_LABELS[breaker.state]}，"
+                        f"成功 {breaker.total_successes} / 失败 {breaker.total_failures}")
+                if breaker.state == OPEN:
+                    line += f"，{int(breaker.retry_after())}秒后探测"
+                lines.append(line)
+        return "\n".join(lines)
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """包装底层传输层，除健康探测外所有经过连接池的请求都会更新熔断状态"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, registry: CircuitBreakerRegistry):
+        self.transport = transport
+        self.registry = registry
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.extensions.get(PROBE_EXTENSION):
+            # 探测不受熔断限制，也不影响熔断状态；失效的API由探测结果单独停用
+            return await self.transport.handle_async_request(request)
+        breakers = self.registry.acquire(str(request.url))
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            for breaker in breakers:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            for breaker in breakers:
+                breaker.release()
+            raise
+        for breaker in breakers:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,64 @@
+"""命令路由：注册时构建字符前缀树，匹配消息只需一次遍历"""
+from typing import Dict, Any, FrozenSet, Iterable, Optional, Tuple
+
+from .apiDescriptor import APIDescriptor
+
+# 命令与参数之间允许的分隔符
+COMMAND_SEPARATORS = frozenset((" ", "，", "-"))
+
+# 前缀树节点中保存命令信息的键，不会与任何单字符键冲突
+_END = ""
+
+
+class CommandRouter:
+    """基于字符前缀树的命令路由器"""
+
+    def __init__(self):
+        self._root: Dict[str, Any] = {}
+        self._size = 0
+        self._disabled: FrozenSet[str] = frozenset()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, command: str, api: APIDescriptor):
+        """注册命令，重复注册时后者覆盖前者"""
+        node = self._root
+        for ch in command:
+            node = node.setdefault(ch, {})
+        if _END not in node:
+            self._size += 1
+        node[_END] = (command, api)
+
+    def set_disabled(self, names: Iterable[str]):
+        """设置停用的API名称，停用的命令仍能匹配，由调用方回复不可用提示"""
+        self._disabled = frozenset(names)
+
+    def is_disabled(self, api: APIDescriptor) -> bool:
+        return api.name in self._disabled
+
+    def match(self, message: str, original: Optional[str] = None) -> Optional[Tuple[str, APIDescriptor, str]]:
+        """
+        匹配消息
+        :param message: 已清理并小写化的消息
+        :param original: 小写化之前的消息，提供时参数部分保留原始大小写（如生图提示词）
+        :return: (命令, API配置, 参数部分)，参数部分不含命令后的分隔符；未匹配返回None
+        """
+        # 个别字符小写化后长度会变化，此时无法按位置对应，参数取小写化后的消息
+        source = original if original is not None and len(original) == len(message) else message
+        node = self._root
+        matched = None
+        length = len(message)
+        for i, ch in enumerate(message):
+            node = node.get(ch)
+            if node is None:
+                break
+            entry = node.get(_END)
+            if entry is not None:
+                if i + 1 == length:
+                    # 精确匹配
+                    return entry[0], entry[1], ""
+                if message[i + 1] in COMMAND_SEPARATORS:
+                    # 命令后紧跟分隔符，记录最长匹配，参数为剩余部分
+                    matched = (entry[0], entry[1], source[i + 2:].strip())
+        return matched
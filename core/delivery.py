@@ -0,0 +1,66 @@
+"""后台投递：慢速指令先回复受理提示，处理在后台完成后通过主动消息接口推送结果"""
+import asyncio
+from typing import Any, AsyncGenerator, Set
+
+from astrbot.api import logger
+from astrbot.api.event import MessageChain
+from astrbot.api.message_components import Plain
+
+
+class BackgroundDelivery:
+    """
+    后台投递队列
+    - 处理方法产生的每条结果通过 context.send_message 主动推送
+    - 并发由请求调度器控制，这里只限制排队与执行中的任务总数，队列满时由调用方在当前协程中处理
+    """
+
+    def __init__(self, context, max_pending: int = 32):
+        self.context = context
+        self.max_pending = max_pending
+        self._pending = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """排队中与执行中的任务数"""
+        return self._pending
+
+    def submit(self, umo: str, results: AsyncGenerator[Any, None], name: str) -> bool:
+        """
+        提交后台任务，立即返回
+        :param umo: 推送目标会话
+        :param results: 处理方法的结果生成器
+        :param name: API名称，用于日志和失败提示
+        :return: 是否受理
+        """
+        if self._pending >= self.max_pending:
+            return False
+        self._pending += 1
+        task = asyncio.create_task(self._run(umo, results, name))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, umo: str, results: AsyncGenerator[Any, None], name: str):
+        try:
+            async for result in results:
+                await self.context.send_message(umo, result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"{name}后台投递失败: {str(e)}", exc_info=True)
+            try:
+                await self.context.send_message(umo, MessageChain(chain=[Plain(f"❌ {name}发送失败，请稍后再试")]))
+            except Exception as e:
+                logger.error(f"{name}失败提示推送失败: {str(e)}")
+        finally:
+            self._pending -= 1
+            # 提前结束时关闭生成器，使其中的finally（释放调度名额、清理临时文件）立即执行
+            await results.aclose()
+
+    async def close(self):
+        """取消所有未完成的任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,78 @@
+"""响应提取：plugin_apis.json 中声明的JSON路径在加载时编译为访问函数，响应体只解析一次"""
+import json
+import re
+from functools import lru_cache
+from typing import Any, Callable, List, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 路径中的一段：.key、key 或 [index]
+_STEP = re.compile(r"\.?([^.\[\]|]+)|\[(-?\d+)\]")
+
+Extractor = Callable[[Any], Any]
+
+
+def parse_json(content: Union[bytes, str]) -> Any:
+    """解析响应体，安装了orjson时使用orjson"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _compile_single(expression: str) -> Extractor:
+    path = expression[1:] if expression.startswith("$") else expression
+    steps: List[Union[str, int]] = []
+    pos = 0
+    while pos < len(path):
+        match = _STEP.match(path, pos)
+        if match is None:
+            raise ValueError(f"无法解析的提取路径: {expression}")
+        key, index = match.groups()
+        steps.append(int(index) if index is not None else key)
+        pos = match.end()
+
+    if not steps:
+        return lambda data: data
+    if len(steps) == 1:
+        step = steps[0]
+
+        def extract_one(data):
+            try:
+                return data[step]
+            except (KeyError, IndexError, TypeError):
+                return None
+        return extract_one
+
+    def extract(data):
+        try:
+            for step in steps:
+                data = data[step]
+            return data
+        except (KeyError, IndexError, TypeError):
+            return None
+    return extract
+
+
+@lru_cache(maxsize=None)
+def compile_path(expression: str) -> Extractor:
+    """
+    把提取路径编译为访问函数，相同路径只编译一次
+    - 语法：data、data[0]、data[0].url、$.result.list[-1]
+    - 用 | 分隔多个候选路径，取第一个非空的结果，如 data|url
+    - 路径不存在时返回None
+    :raises ValueError: 路径语法错误
+    """
+    alternatives = [_compile_single(part.strip()) for part in expression.split("|")]
+    if len(alternatives) == 1:
+        return alternatives[0]
+
+    def first(data):
+        for alternative in alternatives:
+            value = alternative(data)
+            if value not in (None, "", []):
+                return value
+        return None
+    return first
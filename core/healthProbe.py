@@ -0,0 +1,107 @@
+"""API健康探测：后台并发探测所有接口，预热连接并找出失效的API"""
+import asyncio
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+import httpx
+
+from astrbot.api import logger
+
+from .apiDescriptor import APIDescriptor
+from .circuitBreaker import PROBE_EXTENSION
+from .request import RequestManager
+
+# 这些状态码说明接口已不存在；其余4xx（如不支持HEAD返回405）说明服务仍在响应，不视为失效
+DEAD_STATUS = frozenset((404, 410))
+
+
+class HealthProbe:
+    """
+    API健康探测
+    - 在后台按并发上限对每个API发出HEAD请求（不跟随重定向，不下载内容），不阻塞插件初始化
+    - 探测经过共享连接池，顺带完成DNS解析、TLS握手和连接预热
+    - 探测请求带有 PROBE_EXTENSION 标记，不受熔断限制，也不计入熔断状态、运行指标和自适应超时
+    - 主地址和所有镜像都不可用的API记为失效，之后的探测恢复后自动重新启用
+    - 不是普通GET接口的API（如 `生图` 的地址是魔搭服务根地址）在配置中设置 "probe": false 跳过探测
+    """
+
+    def __init__(self, request: RequestManager, max_concurrent: int = 8, timeout: float = 5.0,
+                 on_change: Optional[Callable[[FrozenSet[str]], None]] = None):
+        self.request = request
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.on_change = on_change
+        self.dead: FrozenSet[str] = frozenset()
+        self.results: Dict[str, Tuple[bool, Optional[float], str]] = {}  # API名称 -> (是否可用, 延迟, 失败原因)
+        self.last_probe: Optional[float] = None
+
+    async def probe_api(self, api: APIDescriptor) -> Tuple[bool, Optional[float], str]:
+        """依次探测主地址和镜像，任一可用即视为可用"""
+        client = await self.request.get_client()
+        reason = ""
+        for url in api.urls:
+            started = time.perf_counter()
+            try:
+                resp = await client.head(url, headers=api.headers, params=api.params, timeout=self.timeout,
+                                         extensions={PROBE_EXTENSION: True})
+            except httpx.HTTPError as e:
+                reason = f"{type(e).__name__}: {str(e) or url}"
+                continue
+            if resp.status_code >= 500 or resp.status_code in DEAD_STATUS:
+                reason = f"HTTP {resp.status_code}"
+                continue
+            return True, time.perf_counter() - started, ""
+        return False, None, reason
+
+    async def probe_all(self, descriptors: Iterable[APIDescriptor]):
+        """并发探测全部API，更新失效列表"""
+        apis = [api for api in descriptors if not api.error and api.probe]
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def probe(api: APIDescriptor):
+            async with semaphore:
+                self.results[api.name] = await self.probe_api(api)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(probe(api) for api in apis))
+        self.last_probe = time.time()
+
+        names = {api.name for api in apis}
+        # 已从配置中删除的API不再保留结果
+        for name in list(self.results):
+            if name not in names:
+                del self.results[name]
+        dead = frozenset(name for name, (alive, _, _) in self.results.items() if not alive)
+        logger.info(f"API健康探测完成: {len(apis) - len(dead)}/{len(apis)} 可用，"
+                    f"耗时 {time.perf_counter() - started:.1f}秒")
+        for name in sorted(dead - self.dead):
+            logger.warning(f"API已停用: {name}（{self.results[name][2]}）")
+        for name in sorted(self.dead - dead):
+            logger.info(f"API已恢复: {name}")
+        if dead != self.dead:
+            self.dead = dead
+            if self.on_change:
+                self.on_change(dead)
+
+    async def run(self, get_descriptors: Callable[[], Dict[str, APIDescriptor]], interval: float):
+        """启动后立即探测一次，interval大于0时周期性重复；每轮使用最新的API配置"""
+        while True:
+            try:
+                await self.probe_all(get_descriptors().values())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"API健康探测失败: {str(e)}", exc_info=True)
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+    def describe(self) -> str:
+        """生成探测结果的文本报告"""
+        if self.last_probe is None:
+            return "健康探测：尚未执行"
+        lines = [f"健康探测：{len(self.results) - len(self.dead)}/{len(self.results)} 可用，"
+                 f"{int(time.time() - self.last_probe)}秒前"]
+        for name in sorted(self.dead):
+            lines.append(f"  {name}: 已停用（{self.results[name][2]}）")
+        return "\n".join(lines)
@@ -0,0 +1,96 @@
+"""魔搭生图任务调度：立即受理，后台生成，完成后回调推送"""
+import asyncio
+import datetime
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from astrbot.api import logger
+
+from .request import RequestManager
+
+
+class ImageJobScheduler:
+    """
+    生图任务调度器
+    - 限制同时进行的生成任务数，超出的任务排队等待
+    - 限制排队总数，避免无限堆积
+    - 按自然日统计提交次数，超出每日额度后拒绝受理
+    """
+
+    def __init__(self, request: RequestManager, max_concurrent: int = 2, max_pending: int = 20,
+                 daily_quota: int = 2000):
+        self.request = request
+        self.max_pending = max_pending
+        self.daily_quota = daily_quota
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._pending = 0
+        self._quota_day: Optional[datetime.date] = None
+        self._quota_used = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """排队中与生成中的任务数"""
+        return self._pending
+
+    @property
+    def remaining_quota(self) -> int:
+        """今日剩余额度"""
+        if self._quota_day != datetime.date.today():
+            return self.daily_quota
+        return max(0, self.daily_quota - self._quota_used)
+
+    def _consume_quota(self) -> bool:
+        today = datetime.date.today()
+        if self._quota_day != today:
+            self._quota_day = today
+            self._quota_used = 0
+        if self._quota_used >= self.daily_quota:
+            return False
+        self._quota_used += 1
+        return True
+
+    def submit(self, base_url: str, prompt: str,
+               on_done: Callable[[Optional[str]], Awaitable[None]]) -> Tuple[bool, str]:
+        """
+        提交生图任务，立即返回
+        :param on_done: 任务结束后的回调，参数为图片URL，失败时为None
+        :return: (是否受理, 回复给用户的提示)
+        """
+        if self._pending >= self.max_pending:
+            return False, "生图队列已满，请稍后再试"
+        if not self._consume_quota():
+            return False, f"今日生图额度（{self.daily_quota}次）已用完，请明天再试"
+
+        self._pending += 1
+        position = self._pending
+        task = asyncio.create_task(self._run(base_url, prompt, on_done))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True, f"已加入生图队列（第{position}位），生成完成后自动发送"
+
+    async def _run(self, base_url: str, prompt: str, on_done: Callable[[Optional[str]], Awaitable[None]]):
+        image_url = None
+        try:
+            async with self._semaphore:
+                data = await self.request.generate_image(base_url, prompt)
+            if data:
+                image_url = data["output_images"][0]
+                logger.info(f"生图任务完成: {image_url}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"生图任务异常: {str(e)}", exc_info=True)
+        finally:
+            self._pending -= 1
+
+        try:
+            await on_done(image_url)
+        except Exception as e:
+            logger.error(f"生图结果推送失败: {str(e)}", exc_info=True)
+
+    async def close(self):
+        """取消所有未完成的任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
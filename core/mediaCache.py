@@ -0,0 +1,189 @@
+"""按内容哈希寻址的本地媒体缓存，索引保存在SQLite中，重启后仍然有效"""
+import asyncio
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from astrbot.api import logger
+
+# 最近被访问过的文件可能正在发送，淘汰时跳过
+EVICT_GRACE_SECONDS = 60.0
+
+
+class MediaCache:
+    """
+    本地媒体缓存
+    - 文件以内容的sha256命名，相同内容只保存一份
+    - 上游重定向后的最终URL映射到内容哈希，重复请求可直接命中而无需下载
+    - 总大小超过上限时按LRU或LFU淘汰
+    """
+
+    def __init__(self, directory: str, max_bytes: int, policy: str = "lru"):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.policy = policy if policy in ("lru", "lfu") else "lru"
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(self.directory, "index.db"), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                hash TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_urls_hash ON urls(hash);
+        """)
+        self._db.commit()
+
+    def owns(self, path: str) -> bool:
+        """判断文件是否由缓存管理（由缓存管理的文件不应被调用方删除）"""
+        return os.path.abspath(path).startswith(self.directory + os.sep)
+
+    def _lookup_url(self, url: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT e.hash, e.path FROM urls u JOIN entries e ON u.hash = e.hash WHERE u.url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            content_hash, path = row
+            if not os.path.exists(path):
+                self._delete_locked(content_hash)
+                self._db.commit()
+                return None
+            self._touch_locked(content_hash)
+            self._db.commit()
+            return path
+
+    async def lookup_url(self, url: Optional[str]) -> Optional[str]:
+        """根据上游最终URL查找缓存文件，索引查询和更新访问时间在线程中执行，不阻塞事件循环"""
+        if not url:
+            return None
+        try:
+            return await asyncio.to_thread(self._lookup_url, url)
+        except Exception as e:
+            logger.warning(f"查询媒体缓存失败: {str(e)}")
+            return None
+
+    def _touch_locked(self, content_hash: str):
+        self._db.execute(
+            "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE hash = ?",
+            (time.time(), content_hash),
+        )
+
+    def _delete_locked(self, content_hash: str):
+        row = self._db.execute("SELECT path FROM entries WHERE hash = ?", (content_hash,)).fetchone()
+        if row and os.path.exists(row[0]):
+            try:
+                os.remove(row[0])
+            except OSError as e:
+                logger.warning(f"删除缓存文件失败: {str(e)}")
+        self._db.execute("DELETE FROM entries WHERE hash = ?", (content_hash,))
+        self._db.execute("DELETE FROM urls WHERE hash = ?", (content_hash,))
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _store(self, temp_path: str, suffix: str, source_url: Optional[str]) -> str:
+        size = os.path.getsize(temp_path)
+        if size > self.max_bytes:
+            return temp_path
+        content_hash = self._hash_file(temp_path)
+        path = os.path.join(self.directory, content_hash + suffix)
+        with self._lock:
+            row = self._db.execute("SELECT path FROM entries WHERE hash = ?", (content_hash,)).fetchone()
+            if row and os.path.exists(row[0]):
+                # 内容已存在，丢弃新下载的副本
+                os.remove(temp_path)
+                path = row[0]
+                self._touch_locked(content_hash)
+            else:
+                shutil.move(temp_path, path)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (hash, path, size, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+                    (content_hash, path, size, time.time()),
+                )
+            if source_url:
+                self._db.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (source_url, content_hash))
+            self._evict_locked()
+            self._db.commit()
+        return path
+
+    def _store_bytes(self, data: bytes, suffix: str, source_url: Optional[str]):
+        if len(data) > self.max_bytes:
+            return
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, content_hash + suffix)
+        with self._lock:
+            row = self._db.execute("SELECT path FROM entries WHERE hash = ?", (content_hash,)).fetchone()
+            if row and os.path.exists(row[0]):
+                self._touch_locked(content_hash)
+            else:
+                # 先写临时文件再改名，避免其他请求读到写了一半的文件
+                partial_path = path + ".part"
+                with open(partial_path, "wb") as f:
+                    f.write(data)
+                os.replace(partial_path, path)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (hash, path, size, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+                    (content_hash, path, len(data), time.time()),
+                )
+            if source_url:
+                self._db.execute("INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)", (source_url, content_hash))
+            self._evict_locked()
+            self._db.commit()
+
+    async def store_bytes(self, data: bytes, suffix: str, source_url: Optional[str] = None):
+        """将内存中的下载内容写入缓存，调用方继续使用内存中的数据发送"""
+        try:
+            await asyncio.to_thread(self._store_bytes, data, suffix, source_url)
+        except Exception as e:
+            logger.warning(f"写入媒体缓存失败: {str(e)}")
+
+    async def store(self, temp_path: str, suffix: str, source_url: Optional[str] = None) -> str:
+        """
+        将下载好的临时文件纳入缓存，哈希计算和文件移动在线程中执行
+        :return: 缓存中的文件路径；文件超过缓存上限时原样返回临时路径
+        """
+        try:
+            return await asyncio.to_thread(self._store, temp_path, suffix, source_url)
+        except Exception as e:
+            logger.warning(f"写入媒体缓存失败: {str(e)}")
+            return temp_path
+
+    def _evict_locked(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        order = "hits ASC, last_access ASC" if self.policy == "lfu" else "last_access ASC"
+        candidates = self._db.execute(
+            f"SELECT hash, size FROM entries WHERE last_access < ? ORDER BY {order}",
+            (time.time() - EVICT_GRACE_SECONDS,),
+        ).fetchall()
+        for content_hash, size in candidates:
+            if total <= self.max_bytes:
+                break
+            self._delete_locked(content_hash)
+            total -= size
+            logger.debug(f"媒体缓存已淘汰: {content_hash}")
+
+    def close(self):
+        """关闭索引数据库"""
+        with self._lock:
+            self._db.close()
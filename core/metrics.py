@@ -0,0 +1,239 @@
+"""运行指标：请求数、错误数、延迟分布、下载字节数、缓存命中率、队列深度"""
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Tuple
+
+import httpx
+
+from astrbot.api import logger
+
+from .circuitBreaker import PROBE_EXTENSION
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "omniapi_requests_total": "指令请求次数",
+    "omniapi_errors_total": "指令处理失败次数",
+    "omniapi_upstream_requests_total": "上游HTTP请求次数",
+    "omniapi_upstream_errors_total": "上游HTTP失败次数（连接错误或状态码>=400）",
+    "omniapi_downloaded_bytes_total": "从上游下载的字节数",
+    "omniapi_failovers_total": "切换到镜像地址的次数",
+    "omniapi_hedged_requests_total": "发出对冲请求的次数",
+    "omniapi_repeats_total": "随机接口返回最近发送过的内容而重新获取的次数",
+    "omniapi_cache_hits_total": "缓存命中次数",
+    "omniapi_cache_misses_total": "缓存未命中次数",
+    "omniapi_cache_stale_total": "返回过期缓存并在后台刷新的次数",
+    "omniapi_upstream_latency_seconds": "上游响应首包延迟",
+    "omniapi_command_latency_seconds": "指令端到端处理耗时",
+}
+
+
+class Histogram:
+    """固定分桶的直方图，按桶内线性插值估算分位数"""
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+
+class MetricsRegistry:
+    """进程内指标注册表"""
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, str], float] = {}
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.started_at = time.time()
+
+    def inc(self, name: str, label: str, value: float = 1):
+        key = (name, label)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, label: str, value: float):
+        key = (name, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def cache(self, cache_name: str, hit: bool):
+        """记录一次缓存查询"""
+        self.inc("omniapi_cache_hits_total" if hit else "omniapi_cache_misses_total", cache_name)
+
+    def register_gauge(self, name: str, fn: Callable[[], float]):
+        """注册按需读取的瞬时值，如队列深度"""
+        self.gauges[name] = fn
+
+    def _labels(self, name: str):
+        return sorted(label for metric, label in self.counters if metric == name)
+
+    def report(self, top: int = 10) -> str:
+        """生成给管理员查看的文本报告"""
+        uptime = int(time.time() - self.started_at)
+        lines = [f"运行指标（已运行 {uptime // 3600}小时{uptime % 3600 // 60}分）："]
+
+        requests = {label: self.counters[("omniapi_requests_total", label)]
+                    for label in self._labels("omniapi_requests_total")}
+        lines.append("[指令] 次数 / 失败 / p50 / p95 / p99")
+        for label in sorted(requests, key=requests.get, reverse=True)[:top]:
+            errors = self.counters.get(("omniapi_errors_total", label), 0)
+            histogram = self.histograms.get(("omniapi_command_latency_seconds", label), Histogram())
+            lines.append(f"  {label}: {int(requests[label])} / {int(errors)} / "
+                         f"{histogram.quantile(0.5):.2f}s / {histogram.quantile(0.95):.2f}s / "
+                         f"{histogram.quantile(0.99):.2f}s")
+
+        upstream = sum(v for (name, _), v in self.counters.items() if name == "omniapi_upstream_requests_total")
+        upstream_errors = sum(v for (name, _), v in self.counters.items() if name == "omniapi_upstream_errors_total")
+        downloaded = sum(v for (name, _), v in self.counters.items() if name == "omniapi_downloaded_bytes_total")
+        lines.append(f"[上游] 请求 {int(upstream)}，失败 {int(upstream_errors)}，下载 {downloaded / 1024 / 1024:.1f}MB")
+
+        for cache_name in sorted(set(self._labels("omniapi_cache_hits_total")) |
+                                 set(self._labels("omniapi_cache_misses_total"))):
+            hits = self.counters.get(("omniapi_cache_hits_total", cache_name), 0)
+            misses = self.counters.get(("omniapi_cache_misses_total", cache_name), 0)
+            lines.append(f"[缓存] {cache_name}: 命中率 {hits / (hits + misses) * 100:.1f}%（{int(hits)}/{int(hits + misses)}）")
+
+        for name, fn in self.gauges.items():
+            lines.append(f"[状态] {name}: {fn():g}")
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """生成Prometheus文本格式"""
+        lines = []
+        seen = set()
+        for (name, label), value in sorted(self.counters.items()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f'{name}{{label="{_escape(label)}"}} {value:g}')
+        for (name, label), histogram in sorted(self.histograms.items()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{label="{_escape(label)}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{label="{_escape(label)}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{label="{_escape(label)}"}} {histogram.sum:g}')
+            lines.append(f'{name}_count{{label="{_escape(label)}"}} {histogram.count}')
+        for name, fn in sorted(self.gauges.items()):
+            metric = f"omniapi_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {fn():g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _CountingStream(httpx.AsyncByteStream):
+    """统计响应体字节数的流包装"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_chunk: Callable[[int], None]):
+        self.stream = stream
+        self.on_chunk = on_chunk
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.on_chunk(len(chunk))
+            yield chunk
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """包装底层传输层，记录每个上游端点的请求数、错误数、首包延迟和下载字节数（健康探测不计入）"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, metrics: MetricsRegistry,
+                 label_for: Callable[[str], str]):
+        self.transport = transport
+        self.metrics = metrics
+        self.label_for = label_for
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.extensions.get(PROBE_EXTENSION):
+            return await self.transport.handle_async_request(request)
+        label = self.label_for(str(request.url))
+        self.metrics.inc("omniapi_upstream_requests_total", label)
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            self.metrics.inc("omniapi_upstream_errors_total", label)
+            raise
+        self.metrics.observe("omniapi_upstream_latency_seconds", label, time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.metrics.inc("omniapi_upstream_errors_total", label)
+        response.stream = _CountingStream(
+            response.stream, lambda size: self.metrics.inc("omniapi_downloaded_bytes_total", label, size))
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class PrometheusExporter:
+    """在本地端口上以Prometheus文本格式暴露指标"""
+
+    def __init__(self, metrics: MetricsRegistry, host: str = "127.0.0.1", port: int = 9464):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Prometheus指标已暴露: http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # 读完请求头
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode(errors="ignore").split()
+            if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.metrics.prometheus().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"指标请求处理失败: {str(e)}")
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
@@ -0,0 +1,110 @@
+"""媒体URL预取池：为热门API提前解析好URL，用户请求时直接取用"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional, Set, Tuple
+
+from astrbot.api import logger
+
+from .metrics import MetricsRegistry
+
+
+class URLPrefetcher:
+    """
+    按API维护有界的已解析URL池
+    - 每个URL带有过期时间，过期后丢弃
+    - 池深度由该API最近的请求频率决定，无人请求的API不会预取
+    """
+
+    def __init__(self, max_depth: int = 3, ttl: float = 120.0, rate_window: float = 60.0,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.max_depth = max_depth
+        self.metrics = metrics
+        self.ttl = ttl
+        self.rate_window = rate_window
+        self._pools: Dict[Hashable, Deque[Tuple[str, float]]] = {}
+        self._requests: Dict[Hashable, Deque[float]] = {}
+        self._refilling: Dict[Hashable, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _record_request(self, key: Hashable, now: float):
+        history = self._requests.setdefault(key, deque())
+        history.append(now)
+        while history and now - history[0] > self.rate_window:
+            history.popleft()
+
+    def target_depth(self, key: Hashable) -> int:
+        """根据窗口内的请求次数计算目标池深度"""
+        history = self._requests.get(key)
+        if not history:
+            return 0
+        now = time.monotonic()
+        while history and now - history[0] > self.rate_window:
+            history.popleft()
+        return min(self.max_depth, len(history))
+
+    def _pop(self, key: Hashable, now: float) -> Optional[str]:
+        pool = self._pools.get(key)
+        while pool:
+            url, expires_at = pool.popleft()
+            if expires_at > now:
+                return url
+        return None
+
+    def _prune(self, key: Hashable, now: float) -> Deque[Tuple[str, float]]:
+        pool = self._pools.setdefault(key, deque())
+        while pool and pool[0][1] <= now:
+            pool.popleft()
+        return pool
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """
+        获取URL：优先从池中取，未命中时直接请求上游，随后在后台补充池
+        :param key: 池的键，通常为API名称
+        :param fetch: 解析一个新URL的协程函数
+        """
+        now = time.monotonic()
+        self._record_request(key, now)
+        url = self._pop(key, now)
+        self._schedule_refill(key, fetch)
+        if self.metrics:
+            self.metrics.cache("prefetch", bool(url))
+        if url:
+            logger.debug(f"预取池命中: {key}")
+            return url
+        return await fetch()
+
+    def _schedule_refill(self, key: Hashable, fetch: Callable[[], Awaitable[Optional[str]]]):
+        task = self._refilling.get(key)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self._refill(key, fetch))
+        self._refilling[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key: Hashable, fetch: Callable[[], Awaitable[Optional[str]]]):
+        try:
+            while True:
+                now = time.monotonic()
+                pool = self._prune(key, now)
+                if len(pool) >= self.target_depth(key):
+                    return
+                url = await fetch()
+                if not url:
+                    return
+                pool.append((url, time.monotonic() + self.ttl))
+                logger.debug(f"预取池已补充: {key}，当前深度: {len(pool)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"预取URL失败: {key}: {str(e)}")
+
+    async def close(self):
+        """取消所有后台补充任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._pools.clear()
+        self._refilling.clear()
@@ -0,0 +1,129 @@
+"""按用户和群组的令牌桶限流"""
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# 空闲超过该时间（秒）的令牌桶会被清理
+BUCKET_IDLE_SECONDS = 600.0
+# 清理空闲令牌桶的间隔（秒）
+SWEEP_INTERVAL = 60.0
+
+
+class TokenBucket:
+    """令牌桶：容量为突发上限，按固定速率补充令牌"""
+    __slots__ = ("capacity", "rate", "tokens", "updated", "warned")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate  # 每秒补充的令牌数
+        self.tokens = capacity
+        self.updated = now
+        self.warned = False
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """距离下一个令牌可用的秒数"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    令牌桶限流器
+    - 每个用户、每个群组各一个桶；每个用户在每种API类型上还可单独限流
+    - 每次检查只操作固定数量的桶，O(1)；空闲的桶定期清理
+    - 限额以“每分钟次数”配置，0表示不限
+    """
+
+    def __init__(self, user_per_minute: float = 10, user_burst: int = 5,
+                 group_per_minute: float = 40, group_burst: int = 15,
+                 type_per_minute: Optional[Dict[str, float]] = None):
+        self.user_per_minute = user_per_minute
+        self.user_burst = user_burst
+        self.group_per_minute = group_per_minute
+        self.group_burst = group_burst
+        self.type_per_minute = type_per_minute or {}
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def configure(self, user_per_minute: float, user_burst: int, group_per_minute: float, group_burst: int,
+                  type_per_minute: Dict[str, float]):
+        """应用新的限额：已有令牌桶按新的容量和速率继续计数，改为不限的桶直接丢弃"""
+        self.user_per_minute = user_per_minute
+        self.user_burst = user_burst
+        self.group_per_minute = group_per_minute
+        self.group_burst = group_burst
+        self.type_per_minute = type_per_minute
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            per_minute, burst = self._limits(key)
+            if per_minute <= 0:
+                del self._buckets[key]
+                continue
+            bucket.refill(now)
+            bucket.capacity = max(1.0, burst)
+            bucket.rate = per_minute / 60.0
+            bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+    def _limits(self, key: Hashable) -> Tuple[float, float]:
+        """令牌桶键对应的（每分钟次数, 突发上限）"""
+        if key[0] == "user":
+            return self.user_per_minute, self.user_burst
+        if key[0] == "group":
+            return self.group_per_minute, self.group_burst
+        type_limit = self.type_per_minute.get(key[2], 0)
+        return type_limit, type_limit
+
+    def _bucket(self, key: Hashable, per_minute: float, burst: float, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(max(1.0, burst), per_minute / 60.0, now)
+        else:
+            bucket.refill(now)
+        return bucket
+
+    def check(self, user_id: str, group_id: str, media_type: str) -> Tuple[bool, float, bool]:
+        """
+        检查并消耗令牌
+        :return: (是否放行, 需等待的秒数, 是否需要提示用户)；同一轮限流只提示一次，避免刷屏
+        """
+        now = time.monotonic()
+        if now - self._last_sweep > SWEEP_INTERVAL:
+            self.sweep(now)
+
+        buckets: List[TokenBucket] = []
+        if self.user_per_minute > 0 and user_id:
+            buckets.append(self._bucket(("user", user_id), self.user_per_minute, self.user_burst, now))
+        if self.group_per_minute > 0 and group_id:
+            buckets.append(self._bucket(("group", group_id), self.group_per_minute, self.group_burst, now))
+        type_limit = self.type_per_minute.get(media_type, 0)
+        if type_limit > 0 and user_id:
+            buckets.append(self._bucket(("type", user_id, media_type), type_limit, type_limit, now))
+
+        # 所有桶都有令牌时才一起扣除
+        wait = max((bucket.wait_time() for bucket in buckets), default=0.0)
+        if wait > 0:
+            notify = not any(bucket.warned for bucket in buckets)
+            for bucket in buckets:
+                if bucket.tokens < 1:
+                    bucket.warned = True
+            return False, wait, notify
+
+        for bucket in buckets:
+            bucket.tokens -= 1
+            bucket.warned = False
+        return True, 0.0, False
+
+    def sweep(self, now: Optional[float] = None):
+        """清理长时间空闲的令牌桶"""
+        now = now if now is not None else time.monotonic()
+        self._last_sweep = now
+        idle = [key for key, bucket in self._buckets.items() if now - bucket.updated > BUCKET_IDLE_SECONDS]
+        for key in idle:
+            del self._buckets[key]
@@ -0,0 +1,76 @@
+"""最近发送去重：按会话记录最近发送过的媒体URL和内容哈希，随机接口返回重复内容时重新获取"""
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+# 同时保留记录的会话与API组合数，超出时丢弃最久未使用的
+MAX_RINGS = 4096
+
+
+class RepeatedMedia(Exception):
+    """上游返回了本会话最近发送过的内容"""
+
+
+class RecentRing:
+    """
+    固定容量的环形集合，成员判断和插入都是O(1)
+    写满后新内容覆盖最早的记录
+    """
+    __slots__ = ("_slots", "_members", "_next")
+
+    def __init__(self, capacity: int):
+        self._slots: List[Optional[str]] = [None] * max(1, capacity)
+        self._members = set()
+        self._next = 0
+
+    def __contains__(self, item: str) -> bool:
+        return item in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._slots)
+
+    def add(self, item: str):
+        if not item or item in self._members:
+            return
+        evicted = self._slots[self._next]
+        if evicted is not None:
+            self._members.discard(evicted)
+        self._slots[self._next] = item
+        self._members.add(item)
+        self._next = (self._next + 1) % len(self._slots)
+
+
+class RecentlySent:
+    """
+    按（会话, API名称）维护最近发送记录
+    - 每个组合一个 RecentRing，窗口大小可热更新，变化时已有记录清空
+    - 组合数有上限，超出时淘汰最久未使用的记录
+    """
+
+    def __init__(self, window: int = 20, max_rings: int = MAX_RINGS):
+        self.window = window
+        self.max_rings = max_rings
+        self._rings: "OrderedDict[Hashable, RecentRing]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def resize(self, window: int):
+        """应用新的窗口大小"""
+        if window != self.window:
+            self.window = window
+            self._rings.clear()
+
+    def ring(self, key: Hashable) -> RecentRing:
+        """获取（不存在时创建）某个会话与API的最近发送记录"""
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = RecentRing(self.window)
+            while len(self._rings) > self.max_rings:
+                self._rings.popitem(last=False)
+        else:
+            self._rings.move_to_end(key)
+        return ring
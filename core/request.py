@@ -1,15 +1,48 @@
+import asyncio
+import os
 import random
+import shutil
 import httpx
 import tempfile
-import requests
 import time
 import json
-from PIL import Image
-from io import BytesIO
-from typing import Tuple, Optional, Dict, Any
+from contextlib import asynccontextmanager
+from typing import Tuple, Optional, Dict, Any, List, Mapping, Sequence, Set, Union, AsyncIterator
+from urllib.parse import urlsplit
 
 from astrbot.api import logger
 from .apiManager import APIManager
+from .mediaCache import MediaCache
+from .transcoder import AudioTranscoder
+from .circuitBreaker import CircuitBreakerRegistry, CircuitBreakerTransport
+from .singleFlight import SingleFlight, RandomBatcher
+from .metrics import MetricsRegistry, MetricsTransport
+from .adaptiveTimeout import AdaptiveTimeouts, AdaptiveTimeoutTransport
+from .extractor import Extractor, compile_path, parse_json
+from .responseCache import CachePolicy, ResponseCache
+from .recentlySent import RecentRing, RepeatedMedia
+
+# 未声明extract时各接口默认的提取字段
+TEXT_FIELD = compile_path("text")
+URL_FIELD = compile_path("url")
+DATA_FIELD = compile_path("data")
+
+# httpx接受的请求头形式：字典或APIDescriptor中合并好的元组
+Headers = Union[Mapping[str, str], Sequence[Tuple[str, str]]]
+# 单个地址，或按优先级排列的镜像地址
+URLs = Union[str, Sequence[str]]
+# 下载结果：小文件为内存中的字节，大文件为临时文件路径
+Media = Union[bytes, str]
+# 流式下载每次读取的字节数，按文件大小在上下限之间调整
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 计算对冲等待时间至少需要的延迟样本数
+HEDGE_MIN_SAMPLES = 20
+
+# 生图任务轮询的初始间隔与最大间隔（秒）
+GENERATE_POLL_INITIAL_DELAY = 1.0
+GENERATE_POLL_MAX_DELAY = 8.0
 
 class RequestManager:
     def __init__(self,
@@ -17,200 +50,662 @@ class RequestManager:
                  ):
         # self.config = config
         self.api_manager = APIManager()
-        self.client = None
+        self.client: Optional[httpx.AsyncClient] = None
+        self.media_cache: Optional[MediaCache] = None
+        self.transcoder: Optional[AudioTranscoder] = None
+        self.metrics = MetricsRegistry()
+        self.timeouts = AdaptiveTimeouts()
+        self.responses = ResponseCache(metrics=self.metrics)
+        self._endpoint_names: Dict[str, str] = {}
+        self.coalescer = SingleFlight()
+        self.batcher = RandomBatcher()
+        breaker_config = self.api_manager.get_circuit_breaker_config()
+        self.breakers = CircuitBreakerRegistry(
+            api_failure_threshold=breaker_config["api_failure_threshold"],
+            host_failure_threshold=breaker_config["host_failure_threshold"],
+            recovery_timeout=breaker_config["recovery_timeout"],
+        )
 
     async def initialize(self):
-        """初始化HTTP客户端"""
-        self.client = httpx.AsyncClient(timeout=30.0)
+        """初始化共享的HTTP连接池客户端，整个插件实例只创建一次"""
+        if self.client is not None:
+            return
+        http_config = self.api_manager.get_http_config()
+        http2 = http_config["http2"]
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("未安装h2库，HTTP/2已禁用，可通过 pip install httpx[http2] 启用")
+                http2 = False
+
+        limits = httpx.Limits(
+            max_connections=http_config["max_connections"],
+            max_keepalive_connections=http_config["max_keepalive_connections"],
+            keepalive_expiry=http_config["keepalive_expiry"],
+        )
+        # 为plugin_apis.json中出现的每个上游主机单独分配连接池
+        host_limits = httpx.Limits(
+            max_connections=http_config["per_host_connections"],
+            max_keepalive_connections=http_config["per_host_connections"],
+            keepalive_expiry=http_config["keepalive_expiry"],
+        )
+        # 所有传输层都经过熔断器、指标统计和自适应超时包装
+        mounts = {
+            f"all://{host}": self._wrap_transport(httpx.AsyncHTTPTransport(http2=http2, limits=host_limits))
+            for host in self.api_manager.get_api_hosts()
+        }
+        self.client = httpx.AsyncClient(
+            timeout=http_config["timeout"],
+            transport=self._wrap_transport(httpx.AsyncHTTPTransport(http2=http2, limits=limits)),
+            mounts=mounts,
+        )
+        self._on_config_reload(self.api_manager.store.snapshot)
+        self.api_manager.store.add_listener(self._on_config_reload)
+        logger.info(f"HTTP客户端已创建，HTTP/2: {http2}，独立连接池主机数: {len(mounts)}")
+
+        audio_config = self.api_manager.get_audio_config()
+        self.transcoder = AudioTranscoder(
+            max_workers=audio_config["max_workers"],
+            max_queue=audio_config["max_queue"],
+            timeout=audio_config["timeout"],
+            output_format=audio_config["output_format"],
+        )
 
-    async def get_text(self, url: str, headers: Dict[str, str], params: Dict[str, str]):
-        """发送GET请求，返回响应文本"""
-        # 获取api_key
-        params["ckey"] = self.api_manager.get_ckey()
+        cache_config = self.api_manager.get_media_cache_config()
+        if cache_config["enable"] and self.media_cache is None:
+            try:
+                self.media_cache = MediaCache(cache_config["directory"], cache_config["max_bytes"], cache_config["policy"])
+                logger.info(f"媒体缓存已启用: {self.media_cache.directory}")
+            except Exception as e:
+                logger.error(f"媒体缓存初始化失败: {str(e)}")
+
+    def _wrap_transport(self, transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+        transport = AdaptiveTimeoutTransport(transport, self.timeouts, self._metric_label)
+        return CircuitBreakerTransport(MetricsTransport(transport, self.metrics, self._metric_label), self.breakers)
+
+    def _on_config_reload(self, snapshot):
+        """配置变化时更新超时上下限、响应缓存容量、需要单独熔断的端点和指标标签"""
+        self.timeouts.configure(**self.api_manager.get_timeout_config())
+        self.responses.configure(**self.api_manager.get_response_cache_config())
+        descriptors = snapshot.descriptors.values()
+        self.breakers.set_api_urls([url for api in descriptors for url in api.urls])
+        # 镜像地址与主地址共用API名称作为指标标签
+        self._endpoint_names = {self.breakers.endpoint(url): api.name for api in descriptors for url in api.urls}
+
+    def _metric_label(self, url: str) -> str:
+        """上游指标标签：已配置的API使用API名称，其余（如媒体直链）使用主机名"""
+        name = self._endpoint_names.get(self.breakers.endpoint(url))
+        return name or urlsplit(url).hostname or ""
+
+    def _timeout(self, url: str) -> httpx.Timeout:
+        """按该上游的历史延迟计算本次请求的连接和首包超时"""
+        return self.timeouts.timeout(self._metric_label(url))
+
+    @staticmethod
+    def _flight_key(kind: str, url: URLs, params: Mapping[str, Any]) -> Tuple:
+        """请求合并的键：请求类型、URL与规范化后的参数"""
+        return kind, RequestManager._urls(url), tuple(sorted((k, str(v)) for k, v in params.items()))
+
+    @staticmethod
+    def _cache_key(kind: str, url: URLs, params: Mapping[str, Any], policy: CachePolicy) -> Tuple:
+        """响应缓存的键：请求类型、URL与策略声明的参数"""
+        return kind, RequestManager._urls(url), policy.key(params)
+
+    def _share_file(self, path: Media) -> Media:
+        """为合并请求的每个等待者提供独立的文件，调用方各自删除互不影响；内存中的内容直接共享"""
+        if isinstance(path, bytes) or (self.media_cache and self.media_cache.owns(path)):
+            return path
+        suffix = os.path.splitext(path)[1]
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            shared_path = tmp.name
+        os.remove(shared_path)
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                resp = await client.get(url, headers=headers, params=params)
-                if resp.status_code != 200:
-                    logger.error(f"视频下载失败，状态码: {resp.status_code}")
+            os.link(path, shared_path)
+        except OSError:
+            shutil.copyfile(path, shared_path)
+        return shared_path
+
+    @staticmethod
+    def _cache_source_url(resp: httpx.Response) -> Optional[str]:
+        """
+        获取可用于缓存的上游URL
+        只有发生重定向时最终URL才指向具体文件，未重定向的接口每次返回随机内容，不能按URL缓存
+        """
+        if resp.history:
+            return str(resp.url)
+        return None
+
+    @staticmethod
+    def _urls(url: URLs) -> Tuple[str, ...]:
+        if isinstance(url, str):
+            return (url.strip(),)
+        return tuple(url)
+
+    @staticmethod
+    def _should_failover(resp: httpx.Response) -> bool:
+        """上游出错或限流时改用下一个镜像"""
+        return resp.status_code >= 500 or resp.status_code == 429
+
+    def _hedge_delay(self, url: str) -> float:
+        """对冲等待时间：该API上游首包延迟的p90，样本不足时使用配置的初始值"""
+        hedge_config = self.api_manager.get_hedge_config()
+        histogram = self.metrics.histograms.get(("omniapi_upstream_latency_seconds", self._metric_label(url)))
+        if histogram is None or histogram.count < HEDGE_MIN_SAMPLES:
+            return hedge_config["initial_delay"]
+        return max(hedge_config["min_delay"], histogram.quantile(0.9))
+
+    async def _get(self, url: URLs, headers: Headers, params: Mapping[str, Any], hedge: bool = False) -> httpx.Response:
+        """
+        GET请求，支持镜像故障转移和对冲请求
+        - 连接失败、熔断或返回5xx/429时依次改用下一个镜像
+        - hedge为True时，请求超过p90延迟仍未返回则向下一个镜像（只有一个地址时为同一地址）再发一次，
+          先成功的响应胜出，另一个请求被取消
+        """
+        urls = self._urls(url)
+        client = await self.get_client()
+        if len(urls) == 1 and not hedge:
+            return await client.get(urls[0], headers=headers, params=params, timeout=self._timeout(urls[0]))
+
+        label = self._metric_label(urls[0])
+        candidates = urls * 2 if hedge and len(urls) == 1 else urls
+        hedge_delay = self._hedge_delay(urls[0]) if hedge else None
+        pending: Set[asyncio.Task] = set()
+        launched = 0
+        last_response: Optional[httpx.Response] = None
+        last_error: Optional[Exception] = None
+
+        def launch():
+            nonlocal launched
+            source = candidates[launched]
+            pending.add(asyncio.create_task(client.get(source, headers=headers, params=params,
+                                                       timeout=self._timeout(source))))
+            launched += 1
+
+        launch()
+        try:
+            while pending:
+                wait = hedge_delay if launched == 1 and len(candidates) > 1 else None
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.debug(f"请求超过 {hedge_delay:.2f}秒 未返回，发出对冲请求: {candidates[launched]}")
+                    self.metrics.inc("omniapi_hedged_requests_total", label)
+                    launch()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    try:
+                        resp = task.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if not self._should_failover(resp):
+                        return resp
+                    last_response = resp
+                # 已完成的请求都失败且没有进行中的请求时，切换下一个镜像
+                if not pending and launched < len(candidates):
+                    logger.warning(f"上游请求失败，切换镜像: {candidates[launched]}")
+                    self.metrics.inc("omniapi_failovers_total", label)
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        if last_response is not None:
+            return last_response
+        raise last_error
+
+    @asynccontextmanager
+    async def _stream(self, url: URLs, headers: Headers, params: Mapping[str, Any]) -> AsyncIterator[httpx.Response]:
+        """流式GET请求，在开始读取响应体之前遇到错误、5xx或429时改用下一个镜像，条件与 _get 相同"""
+        urls = self._urls(url)
+        client = await self.get_client()
+        for index, source in enumerate(urls):
+            is_last = index == len(urls) - 1
+            started = False
+            try:
+                async with client.stream("GET", source, headers=headers, params=params, follow_redirects=True,
+                                         timeout=self._timeout(source)) as resp:
+                    if self._should_failover(resp) and not is_last:
+                        logger.warning(f"上游返回 {resp.status_code}，切换镜像: {urls[index + 1]}")
+                        self.metrics.inc("omniapi_failovers_total", self._metric_label(urls[0]))
+                        continue
+                    started = True
+                    yield resp
+                    return
+            except httpx.TransportError as e:
+                # 响应体读取过程中的错误交给调用方处理，不再重试
+                if started or is_last:
+                    raise
+                logger.warning(f"上游请求失败，切换镜像: {urls[index + 1]}: {str(e)}")
+                self.metrics.inc("omniapi_failovers_total", self._metric_label(urls[0]))
+
+    @staticmethod
+    def _chunk_size(size: Optional[int]) -> int:
+        """大文件使用更大的读取块，减少循环次数"""
+        if not size:
+            return DOWNLOAD_CHUNK_SIZE
+        return min(MAX_DOWNLOAD_CHUNK_SIZE, max(DOWNLOAD_CHUNK_SIZE, size // 64))
+
+    async def _download(self, resp: httpx.Response, suffix: str, in_memory: bool = False,
+                        ranged: bool = False) -> Optional[Media]:
+        """
+        读取响应体
+        - in_memory为True且不超过内存阈值时返回字节，不写磁盘
+        - ranged为True且上游支持Range时，大文件分段并行下载
+        - 否则流式写入临时文件并返回路径，写入过程中超过阈值的内存内容会先落盘
+        - 超过大小上限时立即中止下载并返回None；Content-Length已超限时不读取响应体
+        """
+        download_config = self.api_manager.get_download_config()
+        memory_bytes = download_config["memory_bytes"] if in_memory else 0
+        max_bytes = download_config["max_bytes"]
+        content_length = resp.headers.get("Content-Length", "")
+        expected = int(content_length) if content_length.isdigit() else None
+        if max_bytes and expected is not None and expected > max_bytes:
+            logger.warning(f"文件大小 {expected} 字节超过上限 {max_bytes} 字节，放弃下载")
+            return None
+        if expected is not None and expected > memory_bytes:
+            memory_bytes = 0
+        if ranged and self._can_download_ranges(resp, expected, download_config):
+            return await self._download_ranges(resp, expected, suffix, download_config["parts"])
+
+        buffer = bytearray()
+        temp_path = None
+        f = None
+        size = 0
+        completed = False
+        try:
+            async for chunk in resp.aiter_bytes(self._chunk_size(expected)):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    logger.warning(f"下载超过大小上限 {max_bytes} 字节，已中止")
                     return None
-                logger.info(f"文本获取成功，内容: {resp.json()}")
-                json_data = resp.json()  # ✅ await 异步方法
-                text = json_data.get("text")  # ✅ 从 dict 取值
+                if f is None and size <= memory_bytes:
+                    buffer += chunk
+                    continue
+                if f is None:
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                        temp_path = tmp.name
+                    f = open(temp_path, "wb")
+                    f.write(buffer)
+                    buffer = bytearray()
+                f.write(chunk)
+            completed = True
+        finally:
+            if f is not None:
+                f.close()
+                # 中止或出错时删除写了一半的临时文件
+                if not completed:
+                    os.remove(temp_path)
+        if f is None:
+            return bytes(buffer)
+        return temp_path
+
+    async def _read_body(self, resp: httpx.Response) -> Optional[bytes]:
+        """把响应体读入内存（如需送入转码器的语音），同样受单个文件大小上限约束"""
+        max_bytes = self.api_manager.get_download_config()["max_bytes"]
+        content_length = resp.headers.get("Content-Length", "")
+        if max_bytes and content_length.isdigit() and int(content_length) > max_bytes:
+            logger.warning(f"文件大小 {content_length} 字节超过上限 {max_bytes} 字节，放弃下载")
+            return None
+        buffer = bytearray()
+        async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            buffer += chunk
+            if max_bytes and len(buffer) > max_bytes:
+                logger.warning(f"下载超过大小上限 {max_bytes} 字节，已中止")
+                return None
+        return bytes(buffer)
+
+    @staticmethod
+    def _can_download_ranges(resp: httpx.Response, size: Optional[int], download_config: Dict[str, Any]) -> bool:
+        """上游声明支持字节范围、响应未压缩且文件足够大时才分段下载；没有os.pwrite的平台（Windows）不分段"""
+        return (
+            hasattr(os, "pwrite")
+            and download_config["parts"] > 1
+            and size is not None
+            and size >= download_config["parallel_min_bytes"]
+            and resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+            and resp.headers.get("Content-Encoding", "identity").lower() == "identity"
+        )
+
+    async def _download_ranges(self, resp: httpx.Response, size: int, suffix: str, parts: int) -> str:
+        """
+        分段并行下载：原响应继续读取第一段，其余各段通过共享连接池并发发出Range请求，
+        按偏移用os.pwrite写入预分配的临时文件
+        :raises httpx.HTTPError: 任一分段失败时取消其余分段并删除临时文件
+        """
+        part_size = -(-size // parts)
+        chunk_size = self._chunk_size(part_size)
+        url = str(resp.url)
+        client = await self.get_client()
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            temp_path = tmp.name
+        fd = os.open(temp_path, os.O_WRONLY)
+        completed = False
+
+        async def write_range(part: httpx.Response, start: int, end: int):
+            offset = start
+            async for chunk in part.aiter_bytes(chunk_size):
+                chunk = chunk[:end + 1 - offset]
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+                if offset > end:
+                    return
+            raise httpx.ReadError(f"分段下载不完整: bytes={start}-{end}", request=part.request)
+
+        async def fetch_range(start: int, end: int):
+            # 沿用最终请求的请求头（含API配置的User-Agent等）
+            headers = resp.request.headers.copy()
+            headers["Range"] = f"bytes={start}-{end}"
+            async with client.stream("GET", url, headers=headers, timeout=self._timeout(url)) as part:
+                if part.status_code != 206:
+                    raise httpx.HTTPStatusError(f"分段请求未返回206，状态码: {part.status_code}",
+                                                request=part.request, response=part)
+                await write_range(part, start, end)
 
-                return text
+        try:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+            tasks = [asyncio.create_task(write_range(resp, 0, part_size - 1))]
+            tasks += [asyncio.create_task(fetch_range(start, min(start + part_size, size) - 1))
+                      for start in range(part_size, size, part_size)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            completed = True
+        finally:
+            os.close(fd)
+            if not completed:
+                os.remove(temp_path)
+        logger.debug(f"分段下载完成: {len(tasks)} 段，共 {size} 字节")
+        return temp_path
+
+    async def get_client(self) -> httpx.AsyncClient:
+        """获取共享HTTP客户端，未初始化时自动创建"""
+        if self.client is None:
+            await self.initialize()
+        return self.client
+
+    async def get_text(self, url: URLs, headers: Headers, params: Mapping[str, Any], coalesce: bool = False,
+                       extract: Optional[Extractor] = None, hedge: bool = False, cache: Optional[CachePolicy] = None):
+        """发送GET请求，返回响应文本，extract为API声明的提取函数，默认取 text 字段"""
+        if cache is not None:
+            return await self.responses.get(
+                self._cache_key("text", url, params, cache), cache,
+                lambda: self.get_text(url, headers, params, coalesce=coalesce, extract=extract, hedge=hedge))
+        if coalesce:
+            return await self.coalescer.do(self._flight_key("text", url, params),
+                                           lambda: self.get_text(url, headers, params, extract=extract, hedge=hedge))
+        try:
+            resp = await self._get(url, headers=headers, params=params, hedge=hedge)
+            if resp.status_code != 200:
+                logger.error(f"视频下载失败，状态码: {resp.status_code}")
+                return None
+            json_data = parse_json(resp.content)
+            logger.debug(f"文本获取成功，内容: {json_data}")
+            return (extract or TEXT_FIELD)(json_data)
         except Exception as e:
             logger.error(f"文本获取异常: {str(e)}")
             return None
 
-    async def get_audio(self, url: str, headers: Dict[str, str], params: Dict[str, str], role: str, msg: str) -> str | None:
+    async def get_audio(self, url: URLs, headers: Headers, params: Mapping[str, Any], role: str, msg: str) -> str | None:
         """发送GET请求，返回语音文件路径"""
-        # 获取api_key
-        params["ckey"] = self.api_manager.get_ckey()
-        params["msg"] = msg
-        params["id"] = role
+        params = {**params, "msg": msg, "id": role}
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                async with client.stream("GET", url, headers=headers, params=params) as resp:
-                    if resp.status_code != 200:
-                        logger.error(f"语音下载失败，状态码: {resp.status_code}")
-                        return None
-
-                    # 创建临时 .mp3 文件
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-                        temp_path = tmp.name
-
-                    with open(temp_path, "wb") as f:
-                        async for chunk in resp.aiter_bytes(8192):
-                            f.write(chunk)
+            async with self._stream(url, headers=headers, params=params) as resp:
+                if resp.status_code != 200:
+                    logger.error(f"语音下载失败，状态码: {resp.status_code}")
+                    return None
+                data = await self._read_body(resp)
+            if data is None:
+                return None
 
-                    # 转为 .wav或.silk
-                    from pydub import AudioSegment
-                    mp3_file = AudioSegment.from_file(temp_path, format="mp3")
-                    wav_file = mp3_file.export(temp_path, format="wav")
-                    # wav_file.export(temp_path, format="silk")
+            # 在ffmpeg子进程中转为 .wav或.silk
+            temp_path = await self.transcoder.transcode(data, "mp3")
+            if not temp_path:
+                return None
 
-                    logger.info(f"语音下载成功，临时文件: {temp_path}")
-                    return temp_path
+            logger.info(f"语音下载成功，临时文件: {temp_path}")
+            return temp_path
         except Exception as e:
             logger.error(f"语音下载异常: {str(e)}")
             return None
 
-    async def get_audio_url(self, url: str, headers: Dict[str, str], params: Dict[str, str], role: str, msg: str) -> str | None:
+    async def get_audio_url(self, url: URLs, headers: Headers, params: Mapping[str, Any], role: str, msg: str,
+                            extract: Optional[Extractor] = None, hedge: bool = False) -> str | None:
         """发送GET请求，返回语音文件url路径"""
-        # 获取api_key
-        params["ckey"] = self.api_manager.get_ckey()
-        params["msg"] = msg
-        params["id"] = role
+        params = {**params, "msg": msg, "id": role}
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # ✅ 正确：直接 await get，不要 async with
-                resp = await client.get(url, headers=headers, params=params)
+            resp = await self._get(url, headers=headers, params=params, hedge=hedge)
+            if resp.status_code != 200:
+                logger.error(f"语音下载失败，状态码: {resp.status_code}")
+                return None
+
+            data = parse_json(resp.content)
+            logger.debug(data)
+            audio_url = (extract or URL_FIELD)(data)
+            if not audio_url:
+                logger.error(f"语音地址提取失败: {data}")
+                return None
+
+            client = await self.get_client()
+            async with client.stream("GET", audio_url, headers=headers, timeout=self._timeout(audio_url)) as resp:
                 if resp.status_code != 200:
                     logger.error(f"语音下载失败，状态码: {resp.status_code}")
                     return None
+                data = await self._read_body(resp)
+            if data is None:
+                return None
 
-                logger.info(resp.json())
-                audio_url = resp.json()["url"]
-
-                async with client.stream("GET", audio_url, headers=headers) as resp:
-                    if resp.status_code != 200:
-                        logger.error(f"语音下载失败，状态码: {resp.status_code}")
-                        return None
-
-                    # 创建临时 .mp3 文件
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-                        temp_path = tmp.name
-
-                    with open(temp_path, "wb") as f:
-                        async for chunk in resp.aiter_bytes(8192):
-                            f.write(chunk)
-
-                    # 转为 .wav或.silk
-                    from pydub import AudioSegment
-                    mp3_file = AudioSegment.from_file(temp_path, format="mp3")
-                    wav_file = mp3_file.export(temp_path, format="wav")
-                    # wav_file.export(temp_path, format="silk")
+            # 在ffmpeg子进程中转为 .wav或.silk
+            temp_path = await self.transcoder.transcode(data, "mp3")
+            if not temp_path:
+                return None
 
-                    logger.info(f"语音下载成功，临时文件: {temp_path}")
-                    return temp_path
+            logger.info(f"语音下载成功，临时文件: {temp_path}")
+            return temp_path
         except Exception as e:
             logger.error(f"语音下载异常: {str(e)}")
             return None
 
-    async def get_video(self, url: str, headers: Dict[str, str], params: Dict[str, str]) -> str | None:
-        """下载视频，返回临时文件路径"""
-        # 获取api_key
-        params["ckey"] = self.api_manager.get_ckey()
+    def _content_key(self, path: str) -> Optional[str]:
+        """缓存中的文件以内容哈希命名，可作为内容的标识；未纳入缓存的临时文件没有标识"""
+        if self.media_cache and self.media_cache.owns(path):
+            return os.path.splitext(os.path.basename(path))[0]
+        return None
+
+    async def get_video(self, url: URLs, headers: Headers, params: Mapping[str, Any], coalesce: bool = False,
+                        recent: Optional[RecentRing] = None, allow_repeat: bool = False) -> str | None:
+        """
+        下载视频，返回临时文件路径
+        :param recent: 本会话最近发送过的视频，成功后记录本次视频的最终URL和内容哈希
+        :param allow_repeat: 为False时，视频在recent中则抛出RepeatedMedia；上游重定向到具体文件时在下载前即可判断
+        """
+        if coalesce:
+            return await self.coalescer.do(self._flight_key("video", url, params),
+                                           lambda: self.get_video(url, headers, params), share=self._share_file)
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                async with client.stream("GET", url, headers=headers, params=params) as resp:
-                    if resp.status_code != 200:
-                        logger.error(f"视频下载失败，状态码: {resp.status_code}")
-                        return None
-
-                    # 创建临时 .mp4 文件
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp:
-                        temp_path = tmp.name
+            async with self._stream(url, headers=headers, params=params) as resp:
+                if resp.status_code != 200:
+                    logger.error(f"视频下载失败，状态码: {resp.status_code}")
+                    return None
 
-                    with open(temp_path, "wb") as f:
-                        async for chunk in resp.aiter_bytes(8192):
-                            f.write(chunk)
+                # 上游重定向到具体文件时，最近发送过的视频不再下载，命中缓存则无需下载
+                source_url = self._cache_source_url(resp)
+                if recent is not None and not allow_repeat and source_url and source_url in recent:
+                    raise RepeatedMedia(source_url)
+                cached_path = await self.media_cache.lookup_url(source_url) if self.media_cache else None
+                if source_url and self.media_cache:
+                    self.metrics.cache("media", cached_path is not None)
+                if cached_path:
+                    logger.info(f"视频命中本地缓存: {cached_path}")
+                    return self._remember(recent, allow_repeat, cached_path, source_url)
+
+                # 视频组件只能从文件或URL发送，始终写入临时 .mp4 文件
+                temp_path = await self._download(resp, ".mp4", ranged=True)
+                if not temp_path:
+                    return None
 
-                    logger.info(f"视频下载成功，临时文件: {temp_path}")
-                    return temp_path
+            logger.info(f"视频下载成功，临时文件: {temp_path}")
+            if self.media_cache:
+                temp_path = await self.media_cache.store(temp_path, ".mp4", source_url)
+            return self._remember(recent, allow_repeat, temp_path, source_url)
+        except RepeatedMedia:
+            raise
         except Exception as e:
             logger.error(f"视频下载异常: {str(e)}")
             return None
 
-    async def get_video_url(self, url: str, headers: Dict[str, str], params: Dict[str, str]) -> str | None:
+    def _remember(self, recent: Optional[RecentRing], allow_repeat: bool, path: str,
+                  source_url: Optional[str]) -> str:
+        """按内容哈希检查是否重复，未重复时记录最终URL和内容哈希"""
+        if recent is None:
+            return path
+        content_key = self._content_key(path)
+        if not allow_repeat and content_key and content_key in recent:
+            # 重复的文件由缓存管理，保留在缓存中
+            raise RepeatedMedia(content_key)
+        recent.add(source_url)
+        recent.add(content_key)
+        return path
+
+    async def get_video_url(self, url: URLs, headers: Headers, params: Mapping[str, Any], coalesce: bool = False,
+                            extract: Optional[Extractor] = None, hedge: bool = False,
+                            cache: Optional[CachePolicy] = None) -> str | None:
         """发送GET请求，返回文件url路径"""
-        # 获取api_key
-        params["ckey"] = self.api_manager.get_ckey()
+        if cache is not None:
+            return await self.responses.get(
+                self._cache_key("video_url", url, params, cache), cache,
+                lambda: self.get_video_url(url, headers, params, coalesce=coalesce, extract=extract, hedge=hedge))
+        if coalesce:
+            return await self.coalescer.do(self._flight_key("video_url", url, params),
+                                           lambda: self.get_video_url(url, headers, params, extract=extract, hedge=hedge))
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # ✅ 正确：直接 await get，不要 async with
-                resp = await client.get(url, headers=headers, params=params)
-                if resp.status_code != 200:
-                    logger.error(f"视频下载失败，状态码: {resp.status_code}")
-                    return None
-
-                logger.info(resp.json())
-                video_url = resp.json()["data"]
+            resp = await self._get(url, headers=headers, params=params, hedge=hedge)
+            if resp.status_code != 200:
+                logger.error(f"视频下载失败，状态码: {resp.status_code}")
+                return None
 
-                return video_url
+            data = parse_json(resp.content)
+            logger.debug(data)
+            return (extract or DATA_FIELD)(data)
         except Exception as e:
             logger.error(f"视频下载异常: {str(e)}")
             return None
 
-    async def get_image(self, url: str, headers: Dict[str, str], params: Dict[str, str], msg: str) -> str | None:
-        """下载图片，返回临时文件路径"""
-        # 获取api_key
-        params["ckey"] = self.api_manager.get_ckey()
-        params["msg"] = msg
+    async def get_image(self, url: URLs, headers: Headers, params: Mapping[str, Any], msg: str,
+                        coalesce: bool = False, cache: Optional[CachePolicy] = None) -> Media | None:
+        """下载图片，小图片返回内存中的字节，其余返回临时文件路径"""
+        params = {**params, "msg": msg}
+        if cache is not None:
+            # 只缓存内存中的图片；临时文件由调用方删除，不能共享
+            return await self.responses.get(
+                self._cache_key("image", url, params, cache), cache,
+                lambda: self.get_image(url, headers, params, msg, coalesce=coalesce),
+                cacheable=lambda media: isinstance(media, bytes))
+        if coalesce:
+            return await self.coalescer.do(self._flight_key("image", url, params),
+                                           lambda: self.get_image(url, headers, params, msg), share=self._share_file)
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                async with client.stream("GET", url, headers=headers, params=params) as resp:
-                    if resp.status_code != 200:
-                        logger.error(f"图片下载失败，状态码: {resp.status_code}")
-                        return None
-
-                    # 创建临时 .png 文件
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp:
-                        temp_path = tmp.name
+            async with self._stream(url, headers=headers, params=params) as resp:
+                if resp.status_code != 200:
+                    logger.error(f"图片下载失败，状态码: {resp.status_code}")
+                    return None
 
-                    with open(temp_path, "wb") as f:
-                        async for chunk in resp.aiter_bytes(8192):
-                            f.write(chunk)
+                # 上游重定向到具体文件时，命中缓存则无需下载
+                source_url = self._cache_source_url(resp)
+                cached_path = await self.media_cache.lookup_url(source_url) if self.media_cache else None
+                if source_url and self.media_cache:
+                    self.metrics.cache("media", cached_path is not None)
+                if cached_path:
+                    logger.info(f"图片命中本地缓存: {cached_path}")
+                    return cached_path
+
+                media = await self._download(resp, ".png", in_memory=True)
+                if not media:
+                    return None
 
-                    logger.info(f"图片下载成功，临时文件: {temp_path}")
-                    return temp_path
+            if isinstance(media, bytes):
+                logger.info(f"图片下载成功，大小: {len(media)} 字节，从内存发送")
+                # 只有知道上游最终URL时缓存才可能命中
+                if self.media_cache and source_url:
+                    await self.media_cache.store_bytes(media, ".png", source_url)
+                return media
+
+            logger.info(f"图片下载成功，临时文件: {media}")
+            if self.media_cache:
+                media = await self.media_cache.store(media, ".png", source_url)
+            return media
         except Exception as e:
             logger.error(f"图片下载异常: {str(e)}")
             return None
 
-    async def get_image_url(self, url: str, headers: Dict[str, str], params: Dict[str, str], msg: str) -> str | None:
+    async def get_image_url(self, url: URLs, headers: Headers, params: Mapping[str, Any], msg: str,
+                            coalesce: bool = False, extract: Optional[Extractor] = None,
+                            hedge: bool = False, cache: Optional[CachePolicy] = None) -> str | None:
         """下载图片，返回临时文件路径"""
-        # 获取api_key
-        params["ckey"] = self.api_manager.get_ckey()
-        params["msg"] = msg
+        params = {**params, "msg": msg}
+        if cache is not None:
+            return await self.responses.get(
+                self._cache_key("image_url", url, params, cache), cache,
+                lambda: self.get_image_url(url, headers, params, msg, coalesce=coalesce, extract=extract, hedge=hedge))
+        if coalesce:
+            return await self.coalescer.do(self._flight_key("image_url", url, params),
+                                           lambda: self.get_image_url(url, headers, params, msg, extract=extract, hedge=hedge))
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # ✅ 正确：直接 await get，不要 async with
-                resp = await client.get(url, headers=headers, params=params)
-                if resp.status_code != 200:
-                    logger.error(f"图片下载失败，状态码: {resp.status_code}")
-                    return None
-
-                logger.info(resp.json())
-                image_url = resp.json()["data"]
+            resp = await self._get(url, headers=headers, params=params, hedge=hedge)
+            if resp.status_code != 200:
+                logger.error(f"图片下载失败，状态码: {resp.status_code}")
+                return None
 
-                return image_url
+            data = parse_json(resp.content)
+            logger.debug(data)
+            return (extract or DATA_FIELD)(data)
         except Exception as e:
             logger.error(f"图片下载异常: {str(e)}")
             return None
 
 
-    async def get_random_video(self, url: str, headers: Dict[str, str], params: Dict[str, str]) -> str | None:
+    async def get_media_urls(self, url: URLs, headers: Headers, params: Mapping[str, Any], count: int,
+                             batch_param: str = "count", extract: Optional[Extractor] = None,
+                             hedge: bool = False) -> List[str]:
+        """一次请求多个媒体URL，用于合并随机接口的并发请求"""
+        params = {**params, batch_param: str(count)}
+        try:
+            resp = await self._get(url, headers=headers, params=params, hedge=hedge)
+            if resp.status_code != 200:
+                logger.error(f"批量获取URL失败，状态码: {resp.status_code}")
+                return []
+
+            data = (extract or DATA_FIELD)(parse_json(resp.content))
+            if not data:
+                return []
+            urls = data if isinstance(data, list) else [data]
+            logger.info(f"批量获取URL成功，请求 {count} 个，返回 {len(urls)} 个")
+            return urls
+        except Exception as e:
+            logger.error(f"批量获取URL异常: {str(e)}")
+            return []
+
+    async def get_batched_url(self, url: URLs, headers: Headers, params: Mapping[str, Any],
+                              batch_param: str = "count", extract: Optional[Extractor] = None,
+                              hedge: bool = False) -> str | None:
+        """随机接口的并发请求合并为一次 count=N 的上游请求，每个调用者分到不同的一项"""
+        return await self.batcher.submit(
+            self._flight_key("batch", url, params),
+            lambda count: self.get_media_urls(url, headers, params, count, batch_param, extract, hedge),
+        )
+
+    async def get_random_video(self, url: URLs, headers: Headers, params: Mapping[str, Any],
+                               hedge: bool = False) -> str | None:
         """下载视频，返回随机视频文件路径"""
         # url = "https://api.317ak.cn/api/jhsp"
         # headers = {
@@ -235,24 +730,21 @@ class RequestManager:
         params["ckey"] = self.api_manager.get_ckey()
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # ✅ 正确：直接 await get，不要 async with
-                resp = await client.get(url, headers=headers, params=params)
-                if resp.status_code != 200:
-                    logger.error(f"视频下载失败，状态码: {resp.status_code}")
-                    return None
-
-                logger.info(resp.json())
-                video_url = resp.json()["data"]
+            resp = await self._get(url, headers=headers, params=params, hedge=hedge)
+            if resp.status_code != 200:
+                logger.error(f"视频下载失败，状态码: {resp.status_code}")
+                return None
 
-                return video_url
+            data = parse_json(resp.content)
+            logger.debug(data)
+            return DATA_FIELD(data)
         except Exception as e:
             logger.error(f"视频下载异常: {str(e)}")
             return None
 
 
-    async def generate_image(self, base_url: str,prompt: str):
-        """基于魔搭的Z-Image-Turbo模型生图，2000次/日"""
+    async def generate_image(self, base_url: str, prompt: str, timeout: float = 300.0):
+        """基于魔搭的Z-Image-Turbo模型生图，2000次/日；轮询采用带抖动的指数退避，不阻塞事件循环"""
         # 获取api_key
         api_key = self.api_manager.get_modelscope_key()
 
@@ -261,10 +753,11 @@ class RequestManager:
             "Content-Type": "application/json",
         }
 
-        response = requests.post(
+        client = await self.get_client()
+        response = await client.post(
             f"{base_url}v1/images/generations",
             headers={**common_headers, "X-ModelScope-Async-Mode": "true"},
-            data=json.dumps({
+            content=json.dumps({
                 "model": "Tongyi-MAI/Z-Image-Turbo",  # ModelScope Model-Id, required
                 # "loras": "<lora-repo-id>", # optional lora(s)
                 # """
@@ -282,8 +775,10 @@ class RequestManager:
         response.raise_for_status()
         task_id = response.json()["task_id"]
 
+        delay = GENERATE_POLL_INITIAL_DELAY
+        deadline = time.monotonic() + timeout
         while True:
-            result = requests.get(
+            result = await client.get(
                 f"{base_url}v1/tasks/{task_id}",
                 headers={**common_headers, "X-ModelScope-Task-Type": "image_generation"},
             )
@@ -293,16 +788,21 @@ class RequestManager:
             if data["task_status"] == "SUCCEED":
                 return data
             elif data["task_status"] == "FAILED":
-                print("Image Generation Failed.")
+                logger.error(f"生图任务失败: {task_id}")
+                return None
+
+            if time.monotonic() >= deadline:
+                logger.error(f"生图任务超时: {task_id}")
                 return None
 
-            time.sleep(1)
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, GENERATE_POLL_MAX_DELAY)
 
-    async def get_generate_image_url(self, url: str, headers: Dict[str, str], params: Dict[str, str], msg: str) -> str | None:
+    async def get_generate_image_url(self, url: URLs, headers: Headers, params: Mapping[str, Any], msg: str) -> str | None:
         """下载图片，返回临时文件路径"""
         try:
             data = await self.generate_image(url, msg)
-            logger.info(data)
+            logger.debug(data)
             image_url = data["output_images"][0]
 
             return image_url
@@ -312,10 +812,16 @@ class RequestManager:
 
     async def terminate(self):
         """关闭HTTP客户端"""
+        await self.batcher.close()
+        await self.responses.close()
         if self.client:
             await self.client.aclose()
             self.client = None
             logger.info("HTTP客户端已关闭")
+        self.api_manager.store.remove_listener(self._on_config_reload)
+        if self.media_cache:
+            self.media_cache.close()
+            self.media_cache = None
 
 
 
@@ -0,0 +1,216 @@
+"""响应缓存：按API配置的有效期缓存文本和JSON接口的结果，过期后先返回旧值再在后台刷新"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, Mapping, Optional, Set, Tuple
+
+from astrbot.api import logger
+
+from .metrics import MetricsRegistry
+
+
+class CachePolicy:
+    """
+    单个API的缓存策略，由 plugin_apis.json 中的 "cache" 编译而来，创建后不可修改
+    - ttl: 结果的新鲜期（秒）；daily 为True时新鲜期持续到当天结束（本地时间零点）
+    - stale: 新鲜期过后仍可返回旧值的时长（秒），期间在后台刷新；0为过期后同步请求上游
+    - key_params: 参与缓存键的参数名，为空时使用全部参数
+    """
+    __slots__ = ("ttl", "stale", "daily", "key_params")
+
+    def __init__(self, ttl: float, stale: float, daily: bool, key_params: Tuple[str, ...]):
+        object.__setattr__(self, "ttl", ttl)
+        object.__setattr__(self, "stale", stale)
+        object.__setattr__(self, "daily", daily)
+        object.__setattr__(self, "key_params", key_params)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("CachePolicy是只读的")
+
+    def __repr__(self):
+        freshness = "daily" if self.daily else f"ttl={self.ttl:g}"
+        return f"CachePolicy({freshness}, stale={self.stale:g}, key_params={self.key_params!r})"
+
+    @classmethod
+    def parse(cls, config: Optional[Mapping[str, Any]]) -> Optional["CachePolicy"]:
+        """
+        编译API的cache配置，未配置时返回None
+        :raises ValueError: 配置格式错误或没有有效的新鲜期
+        """
+        if not config:
+            return None
+        if not isinstance(config, Mapping):
+            raise ValueError("cache 必须是对象，如 {\"ttl\": 300}")
+        ttl = float(config.get("ttl", 0))
+        daily = bool(config.get("daily", False))
+        stale = float(config.get("stale", 0))
+        key_params = config.get("keyParams") or ()
+        if isinstance(key_params, str):
+            key_params = (key_params,)
+        if ttl <= 0 and not daily:
+            raise ValueError("cache 需要大于0的 ttl 或 \"daily\": true")
+        if stale < 0:
+            raise ValueError("cache.stale 不能为负数")
+        return cls(ttl, stale, daily, tuple(str(name) for name in key_params))
+
+    def fresh_until(self, now: float) -> float:
+        """按本策略计算新存入的结果的新鲜期截止时间（time.time() 时间戳）"""
+        if self.daily:
+            tomorrow = datetime.fromtimestamp(now).date() + timedelta(days=1)
+            return datetime(tomorrow.year, tomorrow.month, tomorrow.day).timestamp()
+        return now + self.ttl
+
+    def key(self, params: Mapping[str, Any]) -> Tuple[Tuple[str, str], ...]:
+        """参数中参与缓存键的部分，已规范化为可哈希的元组"""
+        if self.key_params:
+            return tuple((name, str(params.get(name, ""))) for name in self.key_params)
+        return tuple(sorted((k, str(v)) for k, v in params.items()))
+
+
+def _size_of(value: Any) -> int:
+    """估算缓存值占用的内存"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8", "ignore"))
+    return len(str(value))
+
+
+class _Entry:
+    __slots__ = ("value", "size", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, size: int, fresh_until: float, stale_until: float):
+        self.value = value
+        self.size = size
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class ResponseCache:
+    """
+    有界的LRU响应缓存
+    - 新鲜期内直接返回缓存的结果，不请求上游
+    - 新鲜期过后、旧值可用期内返回旧值，同时在后台刷新（同一个键只有一个刷新任务）
+    - 旧值也过期或没有缓存时同步请求上游；请求失败（返回None）的结果不缓存，刷新失败时保留旧值
+    - 条目数和总字节数都有上限，超出时淘汰最近最少使用的条目
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024,
+                 metrics: Optional[MetricsRegistry] = None):
+        self.enable = True
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def configure(self, enable: bool, max_entries: int, max_bytes: int):
+        """应用配置，容量变小时立即淘汰多余的条目；关闭时清空缓存"""
+        self.enable = enable
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if not enable:
+            self.clear()
+        self._evict()
+
+    async def get(self, key: Hashable, policy: CachePolicy, fetch: Callable[[], Awaitable[Any]],
+                  cacheable: Callable[[Any], bool] = lambda value: value is not None) -> Any:
+        """
+        获取结果：按新鲜度返回缓存或请求上游
+        :param key: 缓存键，应包含请求类型、地址和 policy.key() 的结果
+        :param fetch: 请求上游的协程函数，失败时返回None
+        :param cacheable: 判断结果能否缓存，如只缓存内存中的图片、不缓存临时文件路径
+        """
+        if not self.enable:
+            return await fetch()
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and now >= entry.stale_until:
+            self._remove(key)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            if now >= entry.fresh_until:
+                logger.debug(f"响应缓存已过期，返回旧值并在后台刷新: {key}")
+                if self.metrics:
+                    self.metrics.inc("omniapi_cache_stale_total", "response")
+                self._schedule_refresh(key, policy, fetch, cacheable)
+            if self.metrics:
+                self.metrics.cache("response", True)
+            return entry.value
+
+        if self.metrics:
+            self.metrics.cache("response", False)
+        value = await fetch()
+        if cacheable(value):
+            self._store(key, policy, value)
+        return value
+
+    def _store(self, key: Hashable, policy: CachePolicy, value: Any):
+        size = _size_of(value)
+        # 超过总容量的结果不缓存，避免挤掉所有其他条目
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        fresh_until = policy.fresh_until(now)
+        self._remove(key)
+        self._entries[key] = _Entry(value, size, fresh_until, fresh_until + policy.stale)
+        self.size += size
+        self._evict()
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+
+    def _schedule_refresh(self, key: Hashable, policy: CachePolicy, fetch: Callable[[], Awaitable[Any]],
+                          cacheable: Callable[[Any], bool]):
+        task = self._refreshing.get(key)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self._refresh(key, policy, fetch, cacheable))
+        self._refreshing[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: Hashable, policy: CachePolicy, fetch: Callable[[], Awaitable[Any]],
+                       cacheable: Callable[[Any], bool]):
+        try:
+            value = await fetch()
+            if cacheable(value) and self.enable:
+                self._store(key, policy, value)
+                logger.debug(f"响应缓存已刷新: {key}")
+            else:
+                logger.debug(f"响应缓存刷新失败，保留旧值: {key}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"响应缓存刷新失败: {key}: {str(e)}")
+        finally:
+            if self._refreshing.get(key) is asyncio.current_task():
+                del self._refreshing[key]
+
+    def clear(self):
+        """清空所有条目"""
+        self._entries.clear()
+        self.size = 0
+
+    async def close(self):
+        """取消所有后台刷新任务并清空缓存"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._refreshing.clear()
+        self.clear()
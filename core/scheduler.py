@@ -0,0 +1,124 @@
+"""请求调度：限制并发、按优先级排队，队列满时直接拒绝"""
+import asyncio
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+from astrbot.api import logger
+
+# 数值越小优先级越高：文本 > 图片 > 语音 > 视频
+TYPE_PRIORITY = {"text": 0, "image": 1, "audio": 2, "video": 3}
+
+
+class SchedulerBusy(Exception):
+    """等待队列已满或排队超时"""
+
+
+class RequestScheduler:
+    """
+    API请求调度器
+    - 全局、每个上游主机、每种媒体类型分别限制并发
+    - 超出并发的请求进入有界等待队列，按类型优先级放行；被占满的类型不会阻塞其他类型
+    - 队列已满或等待超时时抛出SchedulerBusy，由调用方回复繁忙提示
+    """
+
+    def __init__(self, max_concurrent: int = 16, per_host: int = 8, per_type: Optional[Dict[str, int]] = None,
+                 max_queue: int = 32, queue_timeout: float = 60.0):
+        self.max_concurrent = max_concurrent
+        self.per_host = per_host
+        self.per_type = per_type or {}
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self._running_hosts: Dict[str, int] = {}
+        self._running_types: Dict[str, int] = {}
+        self._waiters: List[Tuple[int, int, str, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def configure(self, max_concurrent: int, per_host: int, per_type: Dict[str, int],
+                  max_queue: int, queue_timeout: float):
+        """
+        应用新的并发与排队限制
+        调高上限时立即放行可执行的排队请求；调低时正在执行的请求不受影响，归还名额后按新上限放行
+        """
+        self.max_concurrent = max_concurrent
+        self.per_host = per_host
+        self.per_type = per_type
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._dispatch()
+
+    @property
+    def waiting(self) -> int:
+        """排队中的请求数"""
+        return len(self._waiters)
+
+    def _has_capacity(self, media_type: str, host: str) -> bool:
+        if self.running >= self.max_concurrent:
+            return False
+        if self._running_hosts.get(host, 0) >= self.per_host:
+            return False
+        type_limit = self.per_type.get(media_type)
+        return type_limit is None or self._running_types.get(media_type, 0) < type_limit
+
+    def _take(self, media_type: str, host: str):
+        self.running += 1
+        self._running_hosts[host] = self._running_hosts.get(host, 0) + 1
+        self._running_types[media_type] = self._running_types.get(media_type, 0) + 1
+
+    async def acquire(self, media_type: str, host: str) -> Tuple[str, str]:
+        """
+        获取执行名额，返回的凭据需交给release归还
+        :raises SchedulerBusy: 队列已满或等待超时
+        """
+        # 每次归还名额都会放行所有可执行的排队请求，仍在排队的请求必然缺少名额，因此有空位即可直接执行
+        if self._has_capacity(media_type, host):
+            self._take(media_type, host)
+            return media_type, host
+
+        if len(self._waiters) >= self.max_queue:
+            logger.warning(f"请求队列已满（{len(self._waiters)}），拒绝 {media_type} 请求")
+            raise SchedulerBusy()
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (TYPE_PRIORITY.get(media_type, len(TYPE_PRIORITY)), next(self._seq), media_type, host, future)
+        self._waiters.append(waiter)
+        self._waiters.sort()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # 已被放行但调用方放弃，归还名额
+                self.release((media_type, host))
+            else:
+                future.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                logger.warning(f"{media_type} 请求排队超时（{self.queue_timeout}秒）")
+                raise SchedulerBusy() from e
+            raise
+        return media_type, host
+
+    def release(self, ticket: Tuple[str, str]):
+        """归还执行名额并放行可执行的排队请求"""
+        media_type, host = ticket
+        self.running -= 1
+        self._running_hosts[host] -= 1
+        if not self._running_hosts[host]:
+            del self._running_hosts[host]
+        self._running_types[media_type] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        # 按优先级依次检查，名额被占满的类型/主机跳过，不阻塞后面的请求
+        for waiter in list(self._waiters):
+            if self.running >= self.max_concurrent:
+                break
+            _, _, media_type, host, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+                continue
+            if self._has_capacity(media_type, host):
+                self._waiters.remove(waiter)
+                self._take(media_type, host)
+                future.set_result(None)
@@ -0,0 +1,143 @@
+"""请求合并：相同的并发请求共享一次上游调用，随机接口则合并为一次批量请求"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+
+class _LeaderCancelled(Exception):
+    """发起调用的协程被取消，等待者需要自己重新发起"""
+
+
+class SingleFlight:
+    """
+    相同键的并发调用只执行一次
+    第一个调用者负责请求上游，其余调用者等待并共享结果
+    第一个调用者被取消（如所在的后台任务关闭）时，等待者不会随之取消，而是由其中一个重新发起调用
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, List[asyncio.Future]] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """正在进行中的上游调用数"""
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                 share: Optional[Callable[[Any], Any]] = None) -> Any:
+        """
+        执行或加入一次调用
+        :param share: 为每个等待者生成各自的结果副本（如临时文件需各自持有），在唤醒等待者前同步执行
+        """
+        waiters = self._calls.get(key)
+        if waiters is not None:
+            future = asyncio.get_running_loop().create_future()
+            waiters.append(future)
+            try:
+                return await future
+            except _LeaderCancelled:
+                return await self.do(key, fn, share)
+
+        self._calls[key] = waiters = []
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            del self._calls[key]
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as e:
+            del self._calls[key]
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+        del self._calls[key]
+        for future in waiters:
+            if future.done():
+                continue
+            try:
+                future.set_result(share(result) if share and result else result)
+            except Exception as e:
+                future.set_exception(e)
+        return result
+
+
+class RandomBatcher:
+    """
+    随机接口的批量合并
+    空闲时请求立即发出；上一批请求进行中到达的调用排队，上一批返回后合并为一次 count=N 的请求
+    """
+
+    def __init__(self, max_batch: int = 10):
+        self.max_batch = max_batch
+        self._queues: Dict[Hashable, List[asyncio.Future]] = {}
+        self._running: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, fetch_many: Callable[[int], Awaitable[List[Any]]]) -> Any:
+        """
+        加入批次并等待分到的一项结果
+        :param fetch_many: 一次请求n项结果的协程函数
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, []).append(future)
+        if key not in self._running:
+            self._running.add(key)
+            task = asyncio.create_task(self._drain(key, fetch_many))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await future
+
+    async def _drain(self, key: Hashable, fetch_many: Callable[[int], Awaitable[List[Any]]]):
+        try:
+            while True:
+                queue = self._queues.get(key)
+                # 丢弃已取消的等待者
+                if queue:
+                    queue[:] = [f for f in queue if not f.done()]
+                if not queue:
+                    break
+                batch = queue[:self.max_batch]
+                del queue[:self.max_batch]
+                try:
+                    items = await fetch_many(len(batch))
+                except asyncio.CancelledError:
+                    # 批次任务被取消（插件卸载）时等待者收到普通异常，由处理方法回复失败提示
+                    for future in batch:
+                        if not future.done():
+                            future.set_exception(RuntimeError("批量请求已取消"))
+                    raise
+                except Exception as e:
+                    for future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                if not items:
+                    for future in batch:
+                        if not future.done():
+                            future.set_result(None)
+                    continue
+                for future, item in zip(batch, items):
+                    if not future.done():
+                        future.set_result(item)
+                # 上游返回数量不足时，剩余的等待者进入下一批
+                queue[:0] = batch[len(items):]
+        finally:
+            self._running.discard(key)
+            if not self._queues.get(key):
+                self._queues.pop(key, None)
+
+    async def close(self):
+        """取消所有进行中的批次"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        for queue in self._queues.values():
+            for future in queue:
+                if not future.done():
+                    future.set_exception(RuntimeError("批量请求已取消"))
+        self._queues.clear()
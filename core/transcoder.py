@@ -0,0 +1,132 @@
+"""语音转码：在ffmpeg子进程中完成，不占用事件循环"""
+import asyncio
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from typing import Optional
+
+from astrbot.api import logger
+
+# SILK编码使用的采样率（QQ语音要求24kHz单声道）
+SILK_SAMPLE_RATE = 24000
+
+
+class AudioTranscoder:
+    """
+    语音转码器
+    - 下载得到的字节直接通过管道送入ffmpeg，无需先落盘再读取
+    - 同时运行的转码数和排队数均有上限，超出时直接拒绝
+    - 单次转码超时后终止子进程
+    - 输出格式为silk时需要安装 silk-python
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, timeout: float = 30.0,
+                 output_format: str = "wav"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.output_format = output_format if output_format in ("wav", "silk") else "wav"
+        self.ffmpeg = shutil.which("ffmpeg")
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._active = 0
+
+        if self.output_format == "silk":
+            try:
+                import pysilk  # noqa: F401
+            except ImportError:
+                logger.warning("未安装silk-python，语音输出格式回退为wav，可通过 pip install silk-python 启用")
+                self.output_format = "wav"
+        if not self.ffmpeg:
+            logger.warning("未找到ffmpeg，语音将以原始格式发送")
+
+    @staticmethod
+    def _temp_path(suffix: str) -> str:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            return tmp.name
+
+    async def transcode(self, data: bytes, input_format: str = "mp3") -> Optional[str]:
+        """
+        将音频字节转码为可发送的语音文件
+        :return: 输出文件路径，队列已满、超时或失败时返回None
+        """
+        if not self.ffmpeg:
+            path = self._temp_path(f".{input_format}")
+            await asyncio.to_thread(self._write_file, path, data)
+            return path
+
+        if self._active >= self.max_workers + self.max_queue:
+            logger.warning(f"语音转码队列已满（{self._active}），拒绝新的转码请求")
+            return None
+
+        self._active += 1
+        try:
+            async with self._semaphore:
+                return await asyncio.wait_for(self._transcode(data, input_format), self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"语音转码超时（{self.timeout}秒）")
+            return None
+        finally:
+            self._active -= 1
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    async def _run_ffmpeg(self, data: bytes, input_format: str, *output_args: str) -> Optional[bytes]:
+        proc = await asyncio.create_subprocess_exec(
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", input_format, "-i", "pipe:0", *output_args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await proc.communicate(data)
+        except asyncio.CancelledError:
+            # 超时或取消时终止子进程，避免遗留僵尸进程
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        if proc.returncode != 0:
+            logger.error(f"ffmpeg转码失败: {stderr.decode(errors='ignore').strip()}")
+            return None
+        return stdout
+
+    async def _transcode(self, data: bytes, input_format: str) -> Optional[str]:
+        if self.output_format == "silk":
+            pcm = await self._run_ffmpeg(data, input_format, "-f", "s16le", "-ac", "1",
+                                         "-ar", str(SILK_SAMPLE_RATE), "pipe:1")
+            if pcm is None:
+                return None
+            path = self._temp_path(".silk")
+            try:
+                await asyncio.to_thread(self._encode_silk, pcm, path)
+            except BaseException:
+                # 编码失败、超时或取消时删除写了一半的输出文件
+                self._remove(path)
+                raise
+            return path
+
+        path = self._temp_path(".wav")
+        try:
+            if await self._run_ffmpeg(data, input_format, path) is None:
+                self._remove(path)
+                return None
+        except BaseException:
+            self._remove(path)
+            raise
+        return path
+
+    @staticmethod
+    def _remove(path: str):
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def _encode_silk(pcm: bytes, path: str):
+        import pysilk
+        with open(path, "wb") as f:
+            pysilk.encode(BytesIO(pcm), f, SILK_SAMPLE_RATE, SILK_SAMPLE_RATE, tencent=True)
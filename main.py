@@ -1,14 +1,31 @@
+import asyncio
+import hashlib
+import os
 import random
+import time
 from typing import Dict, Any, Optional, List, Tuple
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger
 from astrbot.api.message_components import Video, Plain, At, Record, Image
-import httpx
 
 from .core.apiManager import APIManager
 from .core.apiHandle import APIHandle
-from .astrbot_help_generator import generate_help_image, OUTPUT_IMAGE
+from .core.apiDescriptor import APIDescriptor
+from .core.commandRouter import CommandRouter
+from .core.scheduler import RequestScheduler, SchedulerBusy
+from .core.rateLimiter import RateLimiter
+from .core.delivery import BackgroundDelivery
+from .core.healthProbe import HealthProbe
+from .core.metrics import PrometheusExporter
+from .core.extractor import compile_path, parse_json
+from .astrbot_help_generator import generate_help_image, help_image_path, list_help_images
+
+# 4k壁纸接口：地址、可选的分类id和响应提取路径；接口支持 count 参数，一次返回多张
+WALLPAPER_API = "https://api.317ak.cn/api/tp/4kbz/4k"
+WALLPAPER_IDS = (5, 6, 7, 9, 10, 11, 12, 13, 14, 15, 16, 18, 22, 26, 30, 35, 36)
+WALLPAPER_URLS = compile_path("data")
+WALLPAPER_TAG = compile_path("tag")
 
 @register("astrbot_plugin_OmniAPI", "msyloveldx", "AstrBotOmniAPI 多模态娱乐，通过指令获取API的图片、文字、视频等内容并发送。",
           "v1.1.0")
@@ -17,47 +34,77 @@ class Main(Star):
         super().__init__(context)
         self.config = config or {}
         self.api_manager = APIManager()
-        self.api_handle = APIHandle()
-        self.command_map: Dict[str, dict] = {}  # 命令到API配置的映射
+        self.api_handle = APIHandle(context)
+        self.command_map: Dict[str, APIDescriptor] = {}  # 命令到API配置的映射
         self.registered_commands: List[str] = []  # 已注册的命令列表
+        self.router = CommandRouter()  # 命令前缀树路由
+        scheduler_config = self.api_manager.get_scheduler_config()
+        self.scheduler = RequestScheduler(
+            max_concurrent=scheduler_config["max_concurrent"],
+            per_host=scheduler_config["per_host"],
+            per_type=scheduler_config["per_type"],
+            max_queue=scheduler_config["max_queue"],
+            queue_timeout=scheduler_config["queue_timeout"],
+        )
+        self.rate_limiter: Optional[RateLimiter] = None
+        self.apply_rate_limit_config()
+        probe_config = self.api_manager.get_health_probe_config()
+        self.health = HealthProbe(self.api_handle.request, max_concurrent=probe_config["max_concurrent"],
+                                  timeout=probe_config["timeout"], on_change=self.on_health_change)
+        self._health_task: Optional[asyncio.Task] = None
+        self.delivery = BackgroundDelivery(context, max_pending=self.api_manager.get_delivery_config()["max_pending"])
+        self.metrics = self.api_handle.metrics
+        self.metrics.register_gauge("delivery_pending", lambda: self.delivery.pending)
+        self.metrics.register_gauge("apis_disabled", lambda: len(self.health.dead))
+        self.metrics.register_gauge("response_cache_entries", lambda: len(self.api_handle.request.responses))
+        self.metrics.register_gauge("queue_waiting", lambda: self.scheduler.waiting)
+        self.metrics.register_gauge("queue_running", lambda: self.scheduler.running)
+        self.metrics_exporter: Optional[PrometheusExporter] = None
+        self._config_watch_task: Optional[asyncio.Task] = None
+        self._help_text = ""
+        self._help_key = ""
+        self._help_renders: Dict[str, asyncio.Task] = {}  # 命令集哈希 -> 帮助图片渲染任务
+        self._help_retired: List[str] = []  # 上一个命令集的图片，可能仍在发送中，下次渲染时才删除
 
     async def initialize(self):
         """插件初始化方法"""
         logger.info("astrbot_plugin_OmniAPI 插件已初始化")
+        # 创建共享的HTTP连接池客户端
+        await self.api_handle.request.initialize()
         # 加载并注册所有API命令
         await self.load_and_register_commands()
         logger.info(f"已注册指令: {', '.join(self.registered_commands)}")
+        # 配置文件变更时重建命令映射
+        self.api_manager.store.add_listener(self.on_config_reload)
+        interval = self.api_manager.get_reload_interval()
+        if interval > 0:
+            self._config_watch_task = asyncio.create_task(self.api_manager.store.watch(interval))
+        # 健康探测在后台进行，不阻塞初始化
+        probe_config = self.api_manager.get_health_probe_config()
+        if probe_config["enable"]:
+            self._health_task = asyncio.create_task(
+                self.health.run(self.api_manager.get_all_descriptors, probe_config["interval"]))
+        # 可选的Prometheus指标端口，只监听本机
+        metrics_config = self.api_manager.get_metrics_config()
+        if metrics_config["port"] > 0:
+            exporter = PrometheusExporter(self.metrics, metrics_config["host"], metrics_config["port"])
+            try:
+                await exporter.start()
+                self.metrics_exporter = exporter
+            except OSError as e:
+                logger.error(f"Prometheus指标端口启动失败: {str(e)}")
 
     async def load_and_register_commands(self):
         """加载API配置并动态注册所有命令"""
         try:
-            # 获取所有API配置
-            apis = self.api_manager._init_apis()
+            # 获取所有编译后的API配置
+            apis = self.api_manager.get_all_descriptors()
 
             if not apis:
                 logger.warning("未找到任何API配置")
                 return
 
-            # 清空现有映射
-            self.command_map.clear()
-            self.registered_commands.clear()
-
-            # 遍历所有API配置
-            for api_name, api_config in apis.items():
-                # 检查是否有command字段
-                commands = api_config.get("command", [])
-
-                if not commands:
-                    logger.warning(f"API '{api_name}' 未定义command字段，跳过注册")
-                    continue
-
-                # 为每个命令创建映射
-                for cmd in commands:
-                    cmd_clean = cmd.strip().lower()  # 清理命令，统一小写
-                    if cmd_clean:
-                        self.command_map[cmd_clean] = api_config
-                        self.registered_commands.append(cmd_clean)
-                        logger.debug(f"注册命令 '{cmd_clean}' -> API '{api_name}'")
+            self.build_command_map(apis)
 
             # 动态注册所有命令处理器
             await self.register_command_handlers()
@@ -67,6 +114,69 @@ class Main(Star):
         except Exception as e:
             logger.error(f"加载API配置失败: {str(e)}", exc_info=True)
 
+    def build_command_map(self, apis: Dict[str, APIDescriptor]):
+        """根据API配置构建命令映射，构建完成后整体替换"""
+        command_map: Dict[str, APIDescriptor] = {}
+        registered_commands: List[str] = []
+        router = CommandRouter()
+
+        # 遍历所有API配置
+        for api_name, api in apis.items():
+            # 检查是否有command字段，命令在编译时已清理并统一小写
+            if not api.commands:
+                logger.warning(f"API '{api_name}' 未定义command字段，跳过注册")
+                continue
+
+            # 为每个命令创建映射
+            for cmd in api.commands:
+                command_map[cmd] = api
+                router.add(cmd, api)
+                registered_commands.append(cmd)
+                logger.debug(f"注册命令 '{cmd}' -> API '{api_name}'")
+
+        router.set_disabled(self.health.dead)
+        self.command_map = command_map
+        self.registered_commands = registered_commands
+        self.router = router
+        self._help_text = self.build_help_text(command_map)
+        self._help_key = hashlib.sha1(self._help_text.encode("utf-8")).hexdigest()[:16]
+
+    def on_config_reload(self, snapshot):
+        """配置热重载回调，无需重启即可重建命令映射并应用新的并发限制和限流额度"""
+        self.build_command_map(snapshot.descriptors)
+        self.scheduler.configure(**self.api_manager.get_scheduler_config())
+        self.apply_rate_limit_config()
+        logger.info(f"命令映射已重建: {len(self.command_map)} 个命令，配置版本: {snapshot.version}")
+        # 命令集变化时在后台预先渲染帮助图片
+        if self._help_key not in self._help_renders:
+            try:
+                self._schedule_help_render()
+            except RuntimeError:
+                # 不在事件循环中时，留到下次/help_cmd再渲染
+                pass
+
+    def apply_rate_limit_config(self):
+        """按当前配置创建、更新或关闭限流器"""
+        rate_limit_config = self.api_manager.get_rate_limit_config()
+        if not rate_limit_config["enable"]:
+            self.rate_limiter = None
+            return
+        limits = dict(
+            user_per_minute=rate_limit_config["user_per_minute"],
+            user_burst=rate_limit_config["user_burst"],
+            group_per_minute=rate_limit_config["group_per_minute"],
+            group_burst=rate_limit_config["group_burst"],
+            type_per_minute=rate_limit_config["type_per_minute"],
+        )
+        if self.rate_limiter is None:
+            self.rate_limiter = RateLimiter(**limits)
+        else:
+            self.rate_limiter.configure(**limits)
+
+    def on_health_change(self, dead):
+        """健康探测结果变化时更新路由中的停用列表"""
+        self.router.set_disabled(dead)
+
     async def register_command_handlers(self):
         """动态注册所有命令的处理器"""
         if not self.command_map:
@@ -81,120 +191,139 @@ class Main(Star):
 
     async def handle_command(self, event: AstrMessageEvent):
         """统一处理所有命令"""
-        message_str = event.message_str.strip().lower()
+        raw_message = event.message_str.strip()
+        message_str = raw_message.lower()
         logger.debug(f"收到消息: '{message_str}'")
 
-        # 精确匹配
-        if message_str in self.command_map:
-            api_config = self.command_map[message_str]
-            logger.info(f"精确匹配指令: '{message_str}' -> API: {api_config.get('name', 'unknown')}")
-            # await self.process_api_request(api_config, event)
-            async for result in self.process_api_request(api_config, event):
-                yield result
+        matched = self.router.match(message_str, raw_message)
+        if matched is None:
+            # 未匹配到命令，不处理
+            logger.debug(f"未匹配到任何命令: '{message_str}'")
             return
 
-        # 部分匹配（处理带参数的命令，如"did 123"）
-        for cmd in self.registered_commands:
-            if message_str.startswith(cmd + " ") or message_str.startswith(cmd + "，") or message_str.startswith(cmd + "-"):
-                api_config = self.command_map[cmd]
-                logger.info(
-                    f"部分匹配指令: '{message_str}' -> 基础命令 '{cmd}' -> API: {api_config.get('name', 'unknown')}")
-                # await self.process_api_request(api_config, event, message_str[len(cmd):].strip())
-                async for result in self.process_api_request(api_config, event, message_str[len(cmd):].strip()):
-                    yield result
-                return
+        cmd, api, args = matched
 
-        # 未匹配到命令，不处理
-        logger.debug(f"未匹配到任何命令: '{message_str}'")
+        # 健康探测判定失效的API直接提示，不再等待上游超时
+        if self.router.is_disabled(api):
+            yield event.plain_result(f"{api.name}暂时不可用，请稍后再试")
+            return
 
-    async def process_api_request(self, api_config: dict, event: AstrMessageEvent, params: str = ""):
-        """处理API请求"""
-        try:
-            api_name = api_config.get("name", "unknown")
-            video_type = api_config.get("videoType", "")
-            image_type = api_config.get("imageType", "")
-            type = api_config.get("type", "")
+        # 按用户/群组限流，同一轮限流只提示一次
+        if self.rate_limiter is not None:
+            allowed, wait, notify = self.rate_limiter.check(
+                str(event.get_sender_id()), str(event.get_group_id() or ""), api.media_type or "")
+            if not allowed:
+                logger.info(f"请求被限流: 用户 {event.get_sender_id()}，指令 '{cmd}'")
+                if notify:
+                    yield event.plain_result(f"操作太频繁，请{int(wait) + 1}秒后再试")
+                return
 
-            logger.info(f"处理API请求: {api_name}, 类型: {video_type}")
+        if cmd == message_str:
+            logger.info(f"精确匹配指令: '{message_str}' -> API: {api.name}")
+        else:
+            # 带参数的命令，如"did 123"
+            logger.info(
+                f"部分匹配指令: '{message_str}' -> 基础命令 '{cmd}' -> API: {api.name}")
+        async for result in self.process_api_request(api, event, args):
+            yield result
+
+    async def process_api_request(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
+        """
+        处理API请求
+        :param args: 路由器解析出的参数部分（命令和分隔符之后的内容）
+        """
+        try:
+            logger.info(f"处理API请求: {api.name}, 类型: {api.mode}")
 
-            if not type:
-                yield event.plain_result(f"API '{api_name}' 未配置type")
+            # 配置无效（缺少type、不支持的类型等）在编译时已确定
+            if api.error:
+                yield event.plain_result(api.error)
                 return
 
-            if api_config.get("type", "") == "video":
-                # 根据视频类型处理
-                if video_type == "video":
-                    # await self.handle_video_type(api_config, event)
-                    async for result in self.api_handle.handle_video_type(api_config, event):
-                        yield result
-                elif video_type == "url":
-                    # await self.handle_url_type(api_config, event)
-                    async for result in self.api_handle.handle_video_url_type(api_config, event):
-                        yield result
-                else:
-                    yield event.plain_result(f"不支持的视频类型: {video_type}")
-
-            elif api_config.get("type", "") == "image":
-                if image_type == "image":
-                    async for result in self.api_handle.handle_image_type(api_config, event):
-                        yield result
-                elif image_type == "url":
-                    async for result in self.api_handle.handle_image_url_type(api_config, event):
-                        yield result
-                else:
-                    yield event.plain_result(f"不支持的图片类型: {video_type}")
+            # 主地址和所有镜像都已熔断时快速失败，不再等待超时
+            breakers = self.api_handle.request.breakers
+            circuit_message = breakers.check(api.url)
+            if circuit_message and all(breakers.check(url) for url in api.urls[1:]):
+                yield event.plain_result(f"{api.name}: {circuit_message}")
+                return
 
-            elif api_config.get("type", "") == "text":
-                async for result in self.api_handle.handle_text_type(api_config, event):
-                    yield result
+            # 慢速类型先回复受理提示，排队、下载和发送在后台完成，当前处理协程立即释放
+            delivery_config = self.api_manager.get_delivery_config()
+            if delivery_config["enable"] and api.media_type in delivery_config["types"]:
+                if self.delivery.submit(event.unified_msg_origin, self.execute_api_request(api, event, args), api.name):
+                    yield event.plain_result(f"正在获取{api.name}，完成后自动发送")
+                    return
+                logger.warning(f"后台投递队列已满，{api.name}在当前协程中处理")
 
-            elif api_config.get("type", "") == "audio":
-                async for result in self.api_handle.handle_audio_type(api_config, event):
-                    yield result
-            else:
-                yield event.plain_result(f"不支持的API类型: {api_config.get('type', '')}")
+            async for result in self.execute_api_request(api, event, args):
+                yield result
 
         except Exception as e:
-            error_msg = f"处理API '{api_config.get('name', 'unknown')}' 失败: {str(e)}"
+            error_msg = f"处理API '{api.name}' 失败: {str(e)}"
             logger.error(error_msg, exc_info=True)
             yield event.plain_result(f"❌ {error_msg}")
 
+    async def execute_api_request(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
+        """排队获取执行名额后调用处理方法，前台处理和后台投递共用"""
+        # 按类型和上游主机排队获取执行名额，队列已满时直接拒绝
+        try:
+            ticket = await self.scheduler.acquire(api.media_type, api.host)
+        except SchedulerBusy:
+            yield event.plain_result("当前请求较多，请稍后再试")
+            return
 
+        self.metrics.inc("omniapi_requests_total", api.name)
+        started = time.perf_counter()
+        try:
+            async for result in self.dispatch_api_request(api, event, args):
+                yield result
+        finally:
+            self.scheduler.release(ticket)
+            self.metrics.observe("omniapi_command_latency_seconds", api.name, time.perf_counter() - started)
 
-    @filter.command("4k壁纸")
-    async def wallpaper_4k(self, event: AstrMessageEvent):
-        """处理4k壁纸"""
-        logger.info(f"收到指令{event.message_str}")
+    async def dispatch_api_request(self, api: APIDescriptor, event: AstrMessageEvent, args: str = ""):
+        """分发到编译时解析好的处理方法"""
+        async for result in self.api_handle.handlers[api.handler](api, event, args):
+            yield result
 
-        url = "https://api.317ak.cn/api/tp/4kbz/4k"
+    async def fetch_wallpapers(self, count: int) -> List[Tuple[str, str]]:
+        """一次请求count张4k壁纸，返回 (图片URL, 分类) 列表；同一批的壁纸属于同一个随机分类"""
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         }
-        idList = [5,6,7,9,10,11,12,13,14,15,16,18,22,26,30,35,36]
-        id_4k = random.choice(idList)
         params = {
             "ckey": self.api_manager.get_ckey(),
-            "count": "1",
-            "id": f"{id_4k}",
-            # "id": "36",
+            "count": str(count),
+            "id": str(random.choice(WALLPAPER_IDS)),
             "type": "json"
         }
+        client = await self.api_handle.request.get_client()
+        resp = await client.get(WALLPAPER_API, headers=headers, params=params)
+        if resp.status_code != 200:
+            logger.error(f"图片下载失败，状态码: {resp.status_code}")
+            return []
+
+        data = parse_json(resp.content)
+        logger.debug(data)
+        urls = WALLPAPER_URLS(data) or []
+        tag = WALLPAPER_TAG(data) or "4k壁纸"
+        urls = urls if isinstance(urls, list) else [urls]
+        logger.info(f"4k壁纸获取成功，请求 {count} 张，返回 {len(urls)} 张")
+        return [(str(url), tag) for url in urls if url]
 
-        try:
-            if not url:
-                yield event.plain_result("API配置缺少url字段")
-                return
+    @filter.command("4k壁纸")
+    async def wallpaper_4k(self, event: AstrMessageEvent):
+        """处理4k壁纸"""
+        logger.info(f"收到指令{event.message_str}")
 
-            # 获取图片URL
+        tag = "4k壁纸"
+        try:
+            # 并发的4k壁纸指令合并为一次 count=N 的请求，每人分到不同的一张
+            image_url = None
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    # ✅ 正确：直接 await get，不要 async with
-                    resp = await client.get(url, headers=headers, params=params)
-                    if resp.status_code != 200:
-                        logger.error(f"图片下载失败，状态码: {resp.status_code}")
-
-                    logger.info(resp.json())
-                    image_url = resp.json()["data"][0]
+                item = await self.api_handle.request.batcher.submit(WALLPAPER_API, self.fetch_wallpapers)
+                if item:
+                    image_url, tag = item
             except Exception as e:
                 logger.error(f"图片下载异常: {str(e)}")
 
@@ -205,15 +334,31 @@ class Main(Star):
             # 发送视频URL
             chain = [
                 At(qq=event.get_sender_id()),
-                Plain(f"你的{resp.json()['tag']}请查收！"),
+                Plain(f"你的{tag}请查收！"),
                 Image.fromURL(url=str(image_url))
             ]
             yield event.chain_result(chain)
-            logger.info(f"{resp.json()['tag']}发送成功: {image_url}")
+            logger.info(f"{tag}发送成功: {image_url}")
 
         except Exception as e:
-            logger.error(f"{resp.json()['tag']}处理失败: {str(e)}", exc_info=True)
-            yield event.plain_result(f"❌ {resp.json()['tag']}处理失败: {str(e)}")
+            logger.error(f"{tag}处理失败: {str(e)}", exc_info=True)
+            yield event.plain_result(f"❌ {tag}处理失败: {str(e)}")
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("api_status")
+    async def api_status(self, event: AstrMessageEvent):
+        """查看上游接口熔断状态（管理员）"""
+        yield event.plain_result(self.api_handle.request.breakers.describe() + "\n" + self.health.describe())
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("api_metrics")
+    async def api_metrics(self, event: AstrMessageEvent):
+        """查看请求数、延迟分位数、缓存命中率等运行指标（管理员）"""
+        report = self.metrics.report()
+        timeouts = self.api_handle.request.timeouts.report()
+        if timeouts:
+            report += "\n[超时估计]\n" + "\n".join(timeouts)
+        yield event.plain_result(report)
 
     @filter.command("help_cmd")
     async def help_command(self, event: AstrMessageEvent):
@@ -222,14 +367,23 @@ class Main(Star):
             yield event.plain_result("暂无可用指令")
             return
 
-        # Generate help text in Markdown format
+        image_path = await self.get_help_image()
+        chain = [
+            # At(qq=event.get_sender_id()),
+            Image.fromFileSystem(image_path)
+        ]
+        yield event.chain_result(chain)
+
+    @staticmethod
+    def build_help_text(command_map: Dict[str, APIDescriptor]) -> str:
+        """根据命令映射生成Markdown格式的帮助文本"""
         help_text = "## 🌟 可用指令\n\n"
 
         # 按API分组显示命令
         api_commands = {}
-        for cmd, api_config in self.command_map.items():
-            api_name = api_config.get("name", "unknown")
-            description = api_config.get("description", "")
+        for cmd, api in command_map.items():
+            api_name = api.name
+            description = api.description
             if api_name not in api_commands:
                 api_commands[api_name] = []
             api_commands[api_name].append((cmd, description))
@@ -245,14 +399,60 @@ class Main(Star):
 
         help_text += "---\n\n"
         help_text += "发送指令即可获取对应视频内容"
-
-        # help_image = await self.text_to_image(help_text)
-        # yield event.image_result(help_image)
-        # yield event.plain_result(help_text)
-
-        generate_help_image(help_text, OUTPUT_IMAGE)
-        chain = [
-            # At(qq=event.get_sender_id()),
-            Image.fromFileSystem(OUTPUT_IMAGE)
-        ]
-        yield event.chain_result(chain)
\ No newline at end of file
+        return help_text
+
+    def _schedule_help_render(self) -> asyncio.Task:
+        """在工作线程中渲染当前命令集的帮助图片，同一命令集只渲染一次"""
+        key = self._help_key
+        task = self._help_renders.get(key)
+        if task is None:
+            task = asyncio.create_task(self._render_help_image(key, self._help_text))
+            self._help_renders[key] = task
+        return task
+
+    async def _render_help_image(self, key: str, help_text: str) -> str:
+        path = help_image_path(key)
+        if not os.path.exists(path):
+            await asyncio.to_thread(generate_help_image, help_text, path)
+        # 上一个命令集的图片可能正被并发的 /help 发送，保留一轮，到下次渲染时再删除
+        self._help_retired = []
+        for old_key in [k for k in self._help_renders if k != key]:
+            old_task = self._help_renders.pop(old_key)
+            if old_task.done() and not old_task.cancelled() and old_task.exception() is None:
+                self._help_retired.append(old_task.result())
+        # 其余帮助图片（更早的命令集、重启前遗留的和旧版本的 help_cmd.png）不会再被使用，直接删除
+        keep = {os.path.normpath(p) for p in (path, *self._help_retired)}
+        for stale_path in list_help_images(path):
+            if os.path.normpath(stale_path) not in keep:
+                try:
+                    os.remove(stale_path)
+                except OSError as e:
+                    logger.warning(f"删除旧帮助图片失败: {stale_path}: {str(e)}")
+        return path
+
+    async def get_help_image(self) -> str:
+        """获取当前命令集的帮助图片路径，命中缓存时不重新渲染"""
+        task = self._schedule_help_render()
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # 渲染失败时允许下次重试
+            if self._help_renders.get(self._help_key) is task:
+                del self._help_renders[self._help_key]
+            raise
+
+    async def terminate(self):
+        """插件卸载时停止配置监听并关闭共享HTTP客户端"""
+        self.api_manager.store.remove_listener(self.on_config_reload)
+        if self._config_watch_task:
+            self._config_watch_task.cancel()
+            self._config_watch_task = None
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        if self.metrics_exporter:
+            await self.metrics_exporter.stop()
+            self.metrics_exporter = None
+        await self.delivery.close()
+        await self.api_handle.terminate()
+        logger.info("astrbot_plugin_OmniAPI 插件已卸载")
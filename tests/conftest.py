@@ -0,0 +1,5 @@
+"""测试配置：以插件目录为根导入 core 包"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+import pytest
+
+# core 包依赖AstrBot，需在装有AstrBot的环境中运行
+pytest.importorskip("astrbot.api")
+
+from core.commandRouter import CommandRouter
+
+API = object()
+
+
+def make_router():
+    router = CommandRouter()
+    router.add("星座运势", API)
+    router.add("生图", API)
+    return router
+
+
+@pytest.mark.parametrize("message", ["星座运势-白羊", "星座运势 白羊", "星座运势，白羊"])
+def test_match_strips_separator_from_args(message):
+    assert make_router().match(message) == ("星座运势", API, "白羊")
+
+
+def test_match_keeps_original_case_and_inner_separators():
+    raw = "生图-A Cat-in Space"
+    assert make_router().match(raw.lower(), raw) == ("生图", API, "A Cat-in Space")
+
+
+def test_exact_command_has_empty_args():
+    router = make_router()
+    assert router.match("生图") == ("生图", API, "")
+    assert router.match("生图-") == ("生图", API, "")
+    assert router.match("生图猫") is None
@@ -0,0 +1,51 @@
+import asyncio
+
+import httpx
+import pytest
+
+# core 包依赖AstrBot，需在装有AstrBot的环境中运行
+pytest.importorskip("astrbot.api")
+
+from core.adaptiveTimeout import AdaptiveTimeouts, AdaptiveTimeoutTransport
+from core.apiDescriptor import compile_api
+from core.circuitBreaker import CLOSED, CircuitBreakerRegistry, CircuitBreakerTransport
+from core.healthProbe import HealthProbe
+from core.metrics import MetricsRegistry, MetricsTransport
+
+URL = "https://api.example.com/random"
+
+
+class FakeRequest:
+    """只提供 get_client，按 RequestManager 的顺序包装传输层"""
+
+    def __init__(self, handler):
+        self.breakers = CircuitBreakerRegistry(api_failure_threshold=1, host_failure_threshold=1)
+        self.breakers.set_api_urls([URL])
+        self.metrics = MetricsRegistry()
+        self.timeouts = AdaptiveTimeouts()
+        transport = AdaptiveTimeoutTransport(httpx.MockTransport(handler), self.timeouts, lambda url: "随机")
+        transport = CircuitBreakerTransport(MetricsTransport(transport, self.metrics, lambda url: "随机"), self.breakers)
+        self.client = httpx.AsyncClient(transport=transport)
+
+    async def get_client(self):
+        return self.client
+
+
+def test_failed_probe_does_not_open_breaker_or_record_metrics():
+    request = FakeRequest(lambda req: httpx.Response(503))
+    api = compile_api("随机", {"url": URL, "type": "image"}, None)
+
+    async def run():
+        result = await HealthProbe(request).probe_api(api)
+        states = [breaker.state for breaker in request.breakers._breakers(URL)]
+        # 正常请求仍然放行并计入熔断状态
+        resp = await request.client.get(URL)
+        await request.client.aclose()
+        return result, states, resp
+
+    (alive, _, reason), states, resp = asyncio.run(run())
+    assert not alive and reason == "HTTP 503"
+    assert states and all(state == CLOSED for state in states)
+    assert resp.status_code == 503
+    assert all(breaker.state != CLOSED for breaker in request.breakers._breakers(URL))
+    assert request.metrics.counters[("omniapi_upstream_requests_total", "随机")] == 1
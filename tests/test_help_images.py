@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+# 帮助图片模块依赖AstrBot，需在装有AstrBot的环境中运行
+pytest.importorskip("astrbot")
+
+from astrbot_help_generator import help_image_path, list_help_images
+
+
+def test_list_help_images_finds_hashed_and_legacy_images(tmp_path):
+    current = os.path.basename(help_image_path("current"))
+    names = [current, os.path.basename(help_image_path("old")), "help_cmd.png", "other.png"]
+    for name in names:
+        (tmp_path / name).write_bytes(b"")
+
+    found = {os.path.basename(p) for p in list_help_images(str(tmp_path / current))}
+    assert found == set(names[:3])
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+# core 包依赖AstrBot，需在装有AstrBot的环境中运行
+pytest.importorskip("astrbot.api")
+
+from core.singleFlight import RandomBatcher, SingleFlight
+
+
+def test_random_batcher_merges_concurrent_calls_into_one_request():
+    requested = []
+
+    async def fetch_many(count):
+        requested.append(count)
+        await asyncio.sleep(0.01)
+        return [f"item-{i}" for i in range(count)]
+
+    async def run():
+        batcher = RandomBatcher(max_batch=10)
+        results = await asyncio.gather(*(batcher.submit("wallpaper", fetch_many) for _ in range(8)))
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+    assert requested == [8]
+    assert len(set(results)) == 8
+
+
+def test_random_batcher_requeues_callers_when_upstream_returns_fewer_items():
+    requested = []
+
+    async def fetch_many(count):
+        requested.append(count)
+        return [f"item-{len(requested)}-{i}" for i in range(min(count, 3))]
+
+    async def run():
+        batcher = RandomBatcher(max_batch=10)
+        results = await asyncio.gather(*(batcher.submit("wallpaper", fetch_many) for _ in range(5)))
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+    assert requested == [5, 2]
+    assert len(set(results)) == 5
+
+
+def test_single_flight_followers_survive_leader_cancellation():
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    async def run():
+        flight = SingleFlight()
+        leader = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.do("key", fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await asyncio.gather(*followers), leader
+
+    results, leader = asyncio.run(run())
+    assert leader.cancelled()
+    assert results == [2, 2]